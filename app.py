@@ -1,47 +1,60 @@
-import os
 import base64
-import random
+
+from functools import partial
 
 import librosa
 import numpy as np
-import pandas as pd
 import panel as pn
-import soundfile as sf
-
-from scipy.io import wavfile
-from scipy.fft import rfftfreq, rfft, irfft
 
 import scipy.signal
 
 from panel.interact import interact
 
 from bokeh.plotting import figure
-from bokeh.models import ColumnDataSource, Slider, Button, Select, CustomJS, Div
+from bokeh.models import ColumnDataSource, Slider, Button, Select, CustomJS, Div, Range1d, LinearColorMapper, ColorBar
+from bokeh.palettes import Viridis256
 from bokeh.models.formatters import PrintfTickFormatter
 from bokeh.layouts import column, row, Spacer
 
 import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
 from matplotlib import cm
 from matplotlib.colors import Normalize
 
+from audio_server import AUDIO_OPTIONS, AUDIO_STREAMS, audio_url
+from live_playback import LIVE_STREAMS, LIVE_TOGGLE_JS, live_url
+from loaders import READERS
+from render_pool import render_pool
+from render_scheduler import RenderScheduler
+from result_cache import RESULT_CACHE
+from equalizer import Equalizer
+from signal_store import ENGINES, RESPONSES, SignalStore
+from spectrogram import to_db
+from waveform import WaveformPyramid, channel_view, minmax_decimate
+
 # pn.extension('ipywidgets')
 
 
 file_input = pn.widgets.FileInput(
-    accept=".txt,.csv,.wav", width=200, margin=(30, 0, 10, 10))
+    accept=".txt,.csv,.wav,.npy,.parquet,.pcm,.raw", width=200, margin=(30, 0, 10, 10))
+
 
+equalizer = Equalizer()
 
-modes = pn.widgets.Select(name='modes', options=[
-                          'default', 'music', 'vocals'], width=380)
+modes = pn.widgets.Select(name='modes', options=equalizer.modes, width=380)
 
+engines = pn.widgets.Select(
+    name='engine', options=list(ENGINES), width=380)
 
-info_msg = pn.pane.Alert("""<h1 style="font-size: 50px; color: #242020;">Upload a file and start mixing <br> <span style="font-size: 30px; color: grey;">&lpar;only *.csv and *.wav files&rpar;</span></h1>""",
+channel_views = pn.widgets.Select(
+    name='channels', options={"mix": "mix"}, width=380)
+
+
+info_msg = pn.pane.Alert("""<h1 style="font-size: 50px; color: #242020;">Upload a file and start mixing <br> <span style="font-size: 30px; color: grey;">&lpar;*.wav, *.csv, *.npy, *.parquet or raw *.pcm files&rpar;</span></h1>""",
                          alert_type="dark", width=1000, height=400, margin=(0, 0, 0, 0), sizing_mode='stretch_width')
 
 
-input_source = ColumnDataSource(pd.DataFrame())
-output_source = ColumnDataSource(pd.DataFrame())
+input_source = ColumnDataSource(data={"time": [], "amp": []})
+output_source = ColumnDataSource(data={"time": [], "amp": []})
 # updated_output_source = ColumnDataSource(pd.DataFrame())
 
 hover_tools = [
@@ -49,7 +62,7 @@ hover_tools = [
 ]
 
 input_graph = figure(height=280, width=1000,
-                     tools="crosshair,pan,reset,save,wheel_zoom", title="Input Graph", tooltips=hover_tools)
+                     tools="crosshair,pan,reset,save,wheel_zoom", title="Input Graph", tooltips=hover_tools, x_range=Range1d(start=0, end=1))
 
 input_graph.line(x="time", y="amp", source=input_source,
                  line_width=3, line_alpha=0.6)
@@ -69,6 +82,21 @@ default_sliders_values = [0] * 10
 music_sliders_values = [0] * 10
 vocals_sliders_values = [0] * 10
 
+mode_engines = {
+    "default": "fft",
+    "music": "fft",
+    "vocals": "fft",
+}
+
+signal_store = SignalStore(pool=render_pool())
+
+# "window" is what the plotted time columns were decimated over
+waveform_refresh = {"pending": False, "window": None}
+
+audio_tokens = {"input": None, "output": None}
+
+live_stream = {"token": None}
+
 # slider1 = Slider(title="20Hz - 40Hz", value=0.0,
 #                  start=-20.0, end=20.0, step=0.1, format="@[.] {dB}")
 
@@ -101,6 +129,17 @@ reset_sliders = pn.widgets.Button(
 toggle_spectrograms = pn.widgets.Toggle(
     name='Show spectrograms', button_type='success', width=380)
 
+live_playback = pn.widgets.Toggle(
+    name='Live playback', button_type='primary', width=380)
+
+# websocket URL of the session's live stream, read by the toggle's jscallback
+live_playback_url = pn.widgets.TextInput(visible=False)
+
+live_playback.jscallback(value=LIVE_TOGGLE_JS, args={"url": live_playback_url})
+
+# the /live route only exists when the app is started through serve.py
+live_playback.visible = AUDIO_OPTIONS["served"]
+
 
 input_audio = pn.pane.Audio(name='Input Audio')
 input_audio.visible = False
@@ -125,8 +164,34 @@ output_spectrogram_label = pn.Row(
 input_spectrogram_label.visible = False
 output_spectrogram_label.visible = False
 
-input_spectrogram = pn.pane.Matplotlib(object=Figure(), tight=True)
-output_spectrogram = pn.pane.Matplotlib(object=Figure(), tight=True)
+spectrogram_color_mapper = LinearColorMapper(palette=Viridis256)
+
+
+def spectrogram_graph(title, source):
+    graph = figure(height=300, width=500, tools="crosshair,pan,reset,save,wheel_zoom",
+                   title=title, x_range=input_graph.x_range, x_axis_label="time [Second]",
+                   y_axis_label="frequency [Hz]")
+
+    graph.image(image="image", x="x", y="y", dw="dw", dh="dh",
+                source=source, color_mapper=spectrogram_color_mapper)
+
+    graph.add_layout(ColorBar(color_mapper=spectrogram_color_mapper), "right")
+
+    return graph
+
+
+input_spectrogram_source = ColumnDataSource(
+    data={"image": [], "x": [], "y": [], "dw": [], "dh": []})
+output_spectrogram_source = ColumnDataSource(
+    data={"image": [], "x": [], "y": [], "dw": [], "dh": []})
+
+input_spectrogram_graph = spectrogram_graph(
+    "Input Spectrogram", input_spectrogram_source)
+output_spectrogram_graph = spectrogram_graph(
+    "Output Spectrogram", output_spectrogram_source)
+
+input_spectrogram = pn.pane.Bokeh(input_spectrogram_graph)
+output_spectrogram = pn.pane.Bokeh(output_spectrogram_graph)
 
 input_spectrogram.visible = False
 output_spectrogram.visible = False
@@ -147,6 +212,7 @@ def activate_sliders(flag):
 
         reset_sliders.disabled = False
         toggle_spectrograms.disabled = False
+        live_playback.disabled = False
 
     else:
         slider1.disabled = True
@@ -162,6 +228,12 @@ def activate_sliders(flag):
 
         reset_sliders.disabled = True
         toggle_spectrograms.disabled = True
+        live_playback.disabled = True
+
+
+def set_sliders(values):
+    for s, value in zip([slider1, slider2, slider3, slider4, slider5, slider6, slider7, slider8, slider9, slider10], values):
+        s.value = value
 
 
 def flatten_sliders():
@@ -195,25 +267,17 @@ def file_input_callback(*events):
 
 def file_handler(type):
 
-    if type == "wav":
-        file_input.save("input.wav")
-        file_input.save("output.wav")
-    elif type == "csv":
-        if os.path.exists("input.csv"):
-            os.remove("input.csv")
-
-        if os.path.exists("output.csv"):
-            os.remove("output.csv")
-
-        csv_file = open("input.csv", "w")
-        csv_file.write(file_input.value.decode("utf-8"))
-        csv_file.close()
-
-        csv_file = open("output.csv", "w")
-        csv_file.write(file_input.value.decode("utf-8"))
-        csv_file.close()
+    if type in READERS:
+        try:
+            signal_store.open(file_input.filename, type, file_input.value)
+        except Exception as error:
+            # a malformed upload must not take the session down, whatever
+            # the reader raises
+            signal_store.clear()
+            print(f"could not read {file_input.filename}: {error}")
 
     else:
+        signal_store.clear()
         print("file type is not compatible")
 
 
@@ -238,505 +302,196 @@ def graph_visibility(flag):
 
 
 def trigger_spectrogram(spec):
-    current = 0
-
-    if spec == "in":
-        current = input_spectrogram.dpi
-        random_number = random.randint(143, 144)
-        while random_number == current:
-            random_number = random.randint(143, 144)
-        input_spectrogram.dpi = random_number
-    elif spec == "out":
-        current = output_spectrogram.dpi
-        random_number = random.randint(143, 144)
-        while random_number == current:
-            random_number = random.randint(143, 144)
-        output_spectrogram.dpi = random_number
+    update_spectrogram(spec)
 
 
 def plot_input(type):
 
-    if type == "wav":
-
-        fs, data = wavfile.read("input.wav")
+    if signal_store.loaded:
 
-        n_samples = len(data)
-        time = np.linspace(0, n_samples/fs, num=n_samples)
+        channel_views.options = {"mix": "mix", **{
+            f"channel {channel + 1}": channel for channel in range(signal_store.n_channels)}}
+        channel_views.value = "mix"
 
-        df = pd.DataFrame(data={
-            "time": time,
-            "amp": data
-        })
+        start, end = signal_store.time[0], signal_store.time[-1]
 
-        df.astype(float)
+        input_graph.x_range.update(
+            start=start, end=end, reset_start=start, reset_end=end, bounds=(start, end))
 
-        input_source.data = df
-        output_source.data = df
+        refresh_waveforms()
 
         trigger_spectrogram("in")
         trigger_spectrogram("out")
 
-        input_audio.object = "input.wav"
-        output_audio.object = "output.wav"
+        show_audio(input_audio, "input", signal_store.amp)
+
+        update_output_audio()
+
+        start_live_stream()
 
         activate_sliders(True)
         graph_visibility(True)
 
-    elif type == "csv":
-        csv_df = pd.read_csv("input.csv", index_col=False, header=0)
-        csv_df.columns = ["time", "amp"]
+    else:
+        graph_visibility(False)
+        activate_sliders(False)
 
-        csv_df = csv_df.astype(float)
 
-        input_source.data = csv_df
-        output_source.data = csv_df
+def waveform_window():
+    return (signal_store.key, signal_store.view, input_graph.x_range.start, input_graph.x_range.end,
+            input_graph.width)
 
-        times = csv_df["time"].values
-        n_measurements = len(times)
-        timespan_seconds = times[-1] - times[0]
-        sample_rate_hz = int(n_measurements / timespan_seconds)
 
-        data = csv_df["amp"].divide(32767).values
+def decimated_waveform(amp, pyramid):
+    return minmax_decimate(signal_store.time, amp, input_graph.x_range.start, input_graph.x_range.end,
+                           n_points=2 * input_graph.width, pyramid=pyramid, view=signal_store.view)
 
-        if os.path.exists("input.wav"):
-            os.remove("input.wav")
 
-        if os.path.exists("output.wav"):
-            os.remove("output.wav")
+def refresh_waveforms():
+    waveform_refresh["pending"] = False
 
-        sf.write("input.wav", data, sample_rate_hz)
-        sf.write("output.wav", data, sample_rate_hz)
+    if signal_store.loaded:
+        time, amp = decimated_waveform(
+            signal_store.amp, signal_store.input_pyramid)
+        input_source.data = {"time": time, "amp": amp}
 
-        trigger_spectrogram("in")
-        trigger_spectrogram("out")
+        time, amp = decimated_waveform(
+            signal_store.output, signal_store.output_pyramid)
+        output_source.data = {"time": time, "amp": amp}
 
-        input_audio.object = "input.wav"
-        output_audio.object = "output.wav"
+        waveform_refresh["window"] = waveform_window()
 
-        graph_visibility(True)
-        activate_sliders(True)
 
+def update_output_waveform(amp, pyramid):
+    time, amp = decimated_waveform(amp, pyramid)
+
+    # while the plotted window is the one the time column was decimated over
+    # (no pan or zoom refresh pending), only the float32 amp column is sent
+    if waveform_refresh["window"] == waveform_window():
+        output_source.data["amp"] = amp
     else:
-        graph_visibility(False)
-        activate_sliders(False)
+        output_source.data = {"time": time, "amp": amp}
+
+
+def x_range_callback(attr, old, new):
+    # start and end usually change together, refresh once for both
+    if session_doc is None:
+        refresh_waveforms()
+    elif not waveform_refresh["pending"]:
+        waveform_refresh["pending"] = True
+        session_doc.add_next_tick_callback(refresh_waveforms)
+
+
+input_graph.x_range.on_change("start", x_range_callback)
+input_graph.x_range.on_change("end", x_range_callback)
+
+
+def show_audio(pane, name, amp):
+    pane.sample_rate = signal_store.fs
+
+    if not AUDIO_OPTIONS["served"] or session_doc is None:
+        pane.object = signal_store.audio(amp)
+        return
+
+    # a new URL per signal; it is encoded when the player first requests it
+    AUDIO_STREAMS.discard(audio_tokens[name])
+    audio_tokens[name] = AUDIO_STREAMS.register(amp, signal_store.fs,
+                                                   full_scale=signal_store.full_scale)
+    pane.object = audio_url(session_doc, audio_tokens[name])
+
+
+def start_live_stream():
+    live_playback.value = False
+    LIVE_STREAMS.discard(live_stream["token"])
+
+    if AUDIO_OPTIONS["served"] and session_doc is not None:
+        live_stream["token"] = LIVE_STREAMS.register(
+            signal_store.amp, signal_store.fs, current_sliders_values(), equalizer.bands(modes.value),
+            signal_store.full_scale)
+        live_playback_url.value = live_url(session_doc, live_stream["token"])
 
 
 def update_output_audio(*events):
+    show_audio(output_audio, "output", signal_store.output)
+
+
+def render_output(request):
+    renderer, key, mode, sliders_values, view = request
+
+    # going back to a setting seen before skips the render altogether
+    cached = RESULT_CACHE.get(key)
+
+    if cached is None:
+        data = renderer.render(mode, sliders_values)
+        pyramid = WaveformPyramid(channel_view(data, view))
+        cached = RESULT_CACHE.put(key, (data, pyramid), data.nbytes + pyramid.nbytes)
 
-    amp = output_source.data["amp"]
-    time = output_source.data["time"]
+    data, pyramid = cached
+    return renderer, data, pyramid, view
 
-    n_measurements = len(amp)
-    timespan_seconds = time[-1] - time[0]
-    fs = int(n_measurements / timespan_seconds)
 
-    data = amp/(32767)
+def show_output(result):
+    renderer, data, pyramid, view = result
 
-    if os.path.exists("output.wav"):
-        os.remove("output.wav")
+    # a render of a previously loaded file finished after the new upload
+    if not signal_store.owns(renderer):
+        return
 
-    sf.write("output.wav", data, fs)
+    signal_store.set_output(data, pyramid, view)
+
+    update_output_waveform(data, signal_store.output_pyramid)
+
+    update_output_audio()
+
+    trigger_spectrogram("out")
+
+
+def schedule_output(result):
+    if session_doc is None:
+        show_output(result)
+    else:
+        session_doc.add_next_tick_callback(partial(show_output, result))
 
-    output_audio.object = data
-    output_audio.sample_rate = fs
 
+session_doc = pn.state.curdoc
 
-def test_calc(freq_list, fft_list, low, high, coef):
-    start = freq_list.index(low)
-    end = freq_list.index(high)
-    band = fft_list[start:end + 1]
-    updated_band = [coef * i for i in band]
-    return updated_band
+render_scheduler = RenderScheduler(render_output, schedule_output)
+
+def close_session(session_context):
+    render_scheduler.close()
+
+    for token in audio_tokens.values():
+        AUDIO_STREAMS.discard(token)
+
+    LIVE_STREAMS.discard(live_stream["token"])
+
+    # lets the shared store evict this session's signal
+    signal_store.clear()
+
+
+if session_doc is not None:
+    pn.state.on_session_destroyed(close_session)
+
+
+def apply_mode_gain(mode, sliders_values):
+    # live playback picks the gains up on its next block, without a render
+    LIVE_STREAMS.set_gains(live_stream["token"], sliders_values, equalizer.bands(mode))
+
+    engine = mode_engines[mode]
+    render_scheduler.submit((signal_store.renderer(engine), signal_store.result_key(engine, mode, sliders_values),
+                             mode, list(sliders_values), signal_store.view))
 
 
 def default_mode_gain():
-    amp = input_source.data["amp"].tolist()
-    time = input_source.data["time"]
-
-    n_samples = len(amp)
-    timespan_seconds = time[-1] - time[0]
-
-    fs = int(n_samples / timespan_seconds)
-
-    data_fft = rfft(amp).tolist()
-    freq = rfftfreq(n=n_samples, d=1.0/fs).tolist()
-
-    for i, value in enumerate(default_sliders_values):
-
-        coef = 10**(value/20)
-
-        if i == 0:
-            # adding_gain(19.970472013548132, 40.76164835642017, coef)
-            # adding_gain(20, 40, coef)
-            start = freq.index(20)
-            end = freq.index(40)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-        elif i == 1:
-            # adding_gain(41, 80, coef)
-            start = freq.index(41)
-            end = freq.index(80)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-        elif i == 2:
-            # adding_gain(81, 160, coef)
-            start = freq.index(81)
-            end = freq.index(160)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-        elif i == 3:
-            # adding_gain(161, 320, coef)
-            start = freq.index(161)
-            end = freq.index(320)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-        elif i == 4:
-            # adding_gain(321, 640, coef)
-            start = freq.index(321)
-            end = freq.index(640)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 5:
-            # adding_gain(641, 1280, coef)
-            start = freq.index(641)
-            end = freq.index(1280)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 6:
-            # adding_gain(1281, 2560, coef)
-            start = freq.index(1281)
-            end = freq.index(2560)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 7:
-            # adding_gain(2561, 5120, coef)
-            start = freq.index(2561)
-            end = freq.index(5120)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 8:
-            # adding_gain(5121, 10240, coef)
-            start = freq.index(5121)
-            end = freq.index(10240)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 9:
-            # adding_gain(10241, 20000, coef)
-            start = freq.index(10241)
-            try:
-                end = freq.index(20000)
-
-            except ValueError:
-                end = freq.index(max(freq))
-
-            if end < start:
-                tmp = start
-                start = end
-                end = tmp
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-    data = irfft(data_fft)
-
-    output_source.data = pd.DataFrame(data={
-        "time": time,
-        "amp": data
-    })
-
-    data = data/(32767)
-
-    random_number = random.randint(90, 100)
-
-    while random_number == output_audio.volume:
-        random_number = random.randint(90, 100)
-
-    output_audio.volume = random_number
-
-    output_audio.object = "output.wav"
+    apply_mode_gain("default", default_sliders_values)
 
 
 def music_mode_gain():
-    amp = input_source.data["amp"].tolist()
-    time = input_source.data["time"]
-
-    n_samples = len(amp)
-    timespan_seconds = time[-1] - time[0]
-
-    fs = int(n_samples / timespan_seconds)
-
-    data_fft = rfft(amp).tolist()
-    freq = rfftfreq(n=n_samples, d=1.0/fs).tolist()
-
-    for i, value in enumerate(music_sliders_values):
-
-        coef = 10**(value/20)
-
-        if i == 0:
-            # adding_gain(19.970472013548132, 40.76164835642017, coef)
-            # adding_gain(20, 40, coef)
-            start = freq.index(20)
-            end = freq.index(40)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-        elif i == 1:
-            # adding_gain(41, 80, coef)
-            start = freq.index(41)
-            end = freq.index(80)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-        elif i == 2:
-            # adding_gain(81, 160, coef)
-            start = freq.index(81)
-            end = freq.index(160)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-        elif i == 3:
-            # adding_gain(161, 320, coef)
-            start = freq.index(161)
-            end = freq.index(320)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-        elif i == 4:
-            # adding_gain(321, 640, coef)
-            start = freq.index(321)
-            end = freq.index(640)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 5:
-            # adding_gain(641, 1280, coef)
-            start = freq.index(641)
-            end = freq.index(1280)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 6:
-            # adding_gain(1281, 2560, coef)
-            start = freq.index(1281)
-            end = freq.index(2560)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 7:
-            # adding_gain(2561, 5120, coef)
-            start = freq.index(2561)
-            end = freq.index(5120)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 8:
-            # adding_gain(5121, 10240, coef)
-            start = freq.index(5121)
-            end = freq.index(10240)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 9:
-            # adding_gain(10241, 20000, coef)
-            start = freq.index(10241)
-            try:
-                end = freq.index(20000)
-
-            except ValueError:
-                end = freq.index(max(freq))
-
-            if end < start:
-                tmp = start
-                start = end
-                end = tmp
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-    data = irfft(data_fft)
-
-    output_source.data = pd.DataFrame(data={
-        "time": time,
-        "amp": data
-    })
-
-    data = data/(32767)
-
-    random_number = random.randint(90, 100)
-
-    while random_number == output_audio.volume:
-        random_number = random.randint(90, 100)
-
-    output_audio.volume = random_number
-
-    output_audio.object = "output.wav"
+    apply_mode_gain("music", music_sliders_values)
 
 
 def vocals_mode_gain():
-    amp = input_source.data["amp"].tolist()
-    time = input_source.data["time"]
-
-    n_samples = len(amp)
-    timespan_seconds = time[-1] - time[0]
-
-    fs = int(n_samples / timespan_seconds)
-
-    data_fft = rfft(amp).tolist()
-    freq = rfftfreq(n=n_samples, d=1.0/fs).tolist()
-
-    for i, value in enumerate(vocals_sliders_values):
-
-        coef = 10**(value/20)
-
-        if i == 0:
-            # adding_gain(19.970472013548132, 40.76164835642017, coef)
-            # adding_gain(20, 40, coef)
-            start = freq.index(20)
-            end = freq.index(40)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-        elif i == 1:
-            # adding_gain(41, 80, coef)
-            start = freq.index(41)
-            end = freq.index(80)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-        elif i == 2:
-            # adding_gain(81, 160, coef)
-            start = freq.index(81)
-            end = freq.index(160)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-        elif i == 3:
-            # adding_gain(161, 320, coef)
-            start = freq.index(161)
-            end = freq.index(320)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-        elif i == 4:
-            # adding_gain(321, 640, coef)
-            start = freq.index(321)
-            end = freq.index(640)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 5:
-            # adding_gain(641, 1280, coef)
-            start = freq.index(641)
-            end = freq.index(1280)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 6:
-            # adding_gain(1281, 2560, coef)
-            start = freq.index(1281)
-            end = freq.index(2560)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 7:
-            # adding_gain(2561, 5120, coef)
-            start = freq.index(2561)
-            end = freq.index(5120)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 8:
-            # adding_gain(5121, 10240, coef)
-            start = freq.index(5121)
-            end = freq.index(10240)
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-        elif i == 9:
-            # adding_gain(10241, 20000, coef)
-            start = freq.index(10241)
-            try:
-                end = freq.index(20000)
-
-            except ValueError:
-                end = freq.index(max(freq))
-
-            if end < start:
-                tmp = start
-                start = end
-                end = tmp
-
-            band = data_fft[start:end + 1]
-            updated_band = [coef * i for i in band]
-            data_fft = data_fft[:start] + updated_band + data_fft[end+1:]
-
-    data = irfft(data_fft)
-
-    output_source.data = pd.DataFrame(data={
-        "time": time,
-        "amp": data
-    })
-
-    data = data/(32767)
-
-    random_number = random.randint(90, 100)
-
-    while random_number == output_audio.volume:
-        random_number = random.randint(90, 100)
-
-    output_audio.volume = random_number
-
-    output_audio.object = "output.wav"
+    apply_mode_gain("vocals", vocals_sliders_values)
 
 
 def update_data_source():
@@ -750,8 +505,6 @@ def update_data_source():
     elif current_mode == "vocals":
         vocals_mode_gain()
 
-    trigger_spectrogram("out")
-
 
 def update_sliders_value(*events):
     current_mode = modes.value
@@ -777,7 +530,32 @@ def flatten_callback(event):
 
 
 def change_mode(*events):
-    flatten_sliders()
+    # the mode's stored values must match the sliders before switching the
+    # engine renders from them, sliders that keep their value never fire
+    preset = equalizer.preset(modes.value)
+    current_sliders_values()[:] = preset
+
+    engines.value = mode_engines[modes.value]
+    set_sliders(preset)
+
+    if signal_store.loaded:
+        update_data_source()
+
+
+def change_channel_view(*events):
+    if signal_store.loaded and channel_views.value != signal_store.view:
+        signal_store.set_view(channel_views.value)
+
+        refresh_waveforms()
+        trigger_spectrogram("in")
+        trigger_spectrogram("out")
+
+
+def change_engine(*events):
+    mode_engines[modes.value] = engines.value
+
+    if signal_store.loaded:
+        update_data_source()
 
 
 def toggle_spectrograms_callback(*events):
@@ -790,6 +568,9 @@ def toggle_spectrograms_callback(*events):
         input_spectrogram.visible = True
         output_spectrogram.visible = True
 
+        trigger_spectrogram("in")
+        trigger_spectrogram("out")
+
     else:
         input_spectrogram_label.visible = False
         output_spectrogram_label.visible = False
@@ -797,60 +578,67 @@ def toggle_spectrograms_callback(*events):
         output_spectrogram.visible = False
 
 
-def update_spectrogram(spec):
-    if spec == "in":
-        data = input_source.data["amp"].tolist()
-        time = input_source.data["time"]
-    elif spec == "out":
-        data = output_source.data["amp"].tolist()
-        time = output_source.data["time"]
-
-    n_samples = len(time)
-    timespan_seconds = time[-1] - time[0]
+def current_sliders_values():
+    current_mode = modes.value
 
-    fs = int(n_samples / timespan_seconds)
+    if current_mode == "default":
+        return default_sliders_values
+    elif current_mode == "music":
+        return music_sliders_values
+    elif current_mode == "vocals":
+        return vocals_sliders_values
 
-    fig = Figure()
 
-    ax = fig.subplots()
+def update_spectrogram(spec):
+    if toggle_spectrograms.value == False or not signal_store.loaded:
+        return
 
-    fig.supxlabel("time [Second]")
-    fig.supylabel("frequency [Hz]")
+    spectrogram = signal_store.spectrogram()
+    max_columns = input_spectrogram_graph.width
 
-    _, _, _, im = ax.specgram(data, Fs=fs, NFFT=1024)
+    if spec == "in":
+        image = to_db(spectrogram.pooled(max_columns))
 
-    fig.colorbar(im, ax=ax)
+        spectrogram_color_mapper.update(
+            low=float(image.min()), high=float(image.max()))
 
-    if spec == "in":
-        input_spectrogram.object = fig
-    elif spec == "out":
-        output_spectrogram.object = fig
+        x0, x1, y0, y1 = spectrogram.extent
 
+        input_spectrogram_source.data = {
+            "image": [image], "x": [x0], "y": [y0], "dw": [x1 - x0], "dh": [y1 - y0]}
+        output_spectrogram_source.data = dict(input_spectrogram_source.data)
 
-def update_input_spectrograms(*events):
-    update_spectrogram("in")
+    elif spec == "out":
+        # the active engine's response, so the picture matches what is heard
+        engine = mode_engines[modes.value]
+        key = signal_store.result_key(
+            engine, modes.value, current_sliders_values(), "spectrogram", max_columns)
+        image = RESULT_CACHE.get(key)
 
+        if image is None:
+            response = RESPONSES[engine](signal_store.fs, spectrogram.freq,
+                                         current_sliders_values(), equalizer.bands(modes.value))
+            image = to_db(spectrogram.equalized(response, max_columns))
+            RESULT_CACHE.put(key, image, image.nbytes)
 
-def update_output_spectrograms(*events):
-    update_spectrogram("out")
+        # only the image column changes, x/y/dw/dh stay from the input
+        output_spectrogram_source.data["image"] = [image]
 
 
 file_input.param.watch(file_input_callback, "filename")
 
 
-file_input.jslink(input_audio, value="object")
-file_input.jslink(output_audio, value="object")
 
 reset_sliders.on_click(flatten_callback)
 
 modes.param.watch(change_mode, "value")
 
-output_audio.param.watch(update_output_audio, "volume")
+engines.param.watch(change_engine, "value")
+
+channel_views.param.watch(change_channel_view, "value")
 
 toggle_spectrograms.param.watch(toggle_spectrograms_callback, "value")
 
-input_spectrogram.param.watch(update_input_spectrograms, "dpi")
-output_spectrogram.param.watch(update_output_spectrograms, "dpi")
 
 
 in_graph_layout = pn.pane.Bokeh(row(column(
@@ -877,9 +665,10 @@ visual_sec = pn.Column(info_msg, in_graph_layout,
 
 
 sliders = pn.Column(reset_sliders, slider1, slider2, slider3, slider4, slider5,
-                    slider6, slider7, slider8, slider9, slider10, toggle_spectrograms, width=400, margin=(0, 0, 0, 5))
+                    slider6, slider7, slider8, slider9, slider10, toggle_spectrograms, live_playback, live_playback_url,
+                    width=400, margin=(0, 0, 0, 5))
 
 app = pn.Row(pn.layout.HSpacer(), visual_sec, pn.layout.HSpacer(),
-             pn.Column(file_input, modes, sliders), pn.layout.HSpacer())
+             pn.Column(file_input, modes, engines, channel_views, sliders), pn.layout.HSpacer())
 
 app.servable(title="Equalizer")
@@ -0,0 +1,156 @@
+import io
+import re
+import secrets
+import threading
+
+import numpy as np
+import soundfile as sf
+import tornado.web
+
+from tornado.ioloop import IOLoop
+
+
+# The audio panes used to get the whole signal as a base64 WAV data URL over
+# the websocket after every render. When the app is started through serve.py
+# they get a URL instead: the signal is only encoded when the browser first
+# asks for it, and it is served with HTTP range support, so the player can
+# start on the first chunk and seek without downloading the rest.
+
+AUDIO_OPTIONS = {
+    # "wav" (float32, lossless) or "ogg" (Vorbis, roughly a tenth the size)
+    "format": "wav",
+    # set by serve.py once the /audio route is installed
+    "served": False,
+}
+
+AUDIO_FORMATS = {
+    "wav": ("WAV", "FLOAT", "audio/wav"),
+    "ogg": ("OGG", "VORBIS", "audio/ogg"),
+}
+
+
+def encode_audio(amp, fs, format="wav", full_scale=32767):
+    # amp is (channels x samples) with a full-scale sample at full_scale, like
+    # the app's signals
+    container, subtype, _ = AUDIO_FORMATS[format]
+    frames = np.atleast_2d(amp).T / np.float32(full_scale)
+
+    buffer = io.BytesIO()
+    sf.write(buffer, frames.astype(np.float32, copy=False), fs, subtype=subtype, format=container)
+    return buffer.getvalue()
+
+
+class AudioStreams:
+    # token -> how to encode one signal, and the encoded bytes once a player
+    # asked for them. Tokens are unguessable, so a session's audio can only
+    # be fetched with the URL it was given.
+
+    def __init__(self):
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def register(self, amp, fs, format=None, full_scale=32767):
+        token = secrets.token_urlsafe(16)
+
+        with self._lock:
+            self._streams[token] = {"amp": amp, "fs": fs, "full_scale": full_scale,
+                                    "format": format or AUDIO_OPTIONS["format"],
+                                    "data": None, "lock": threading.Lock()}
+
+        return token
+
+    def discard(self, token):
+        with self._lock:
+            self._streams.pop(token, None)
+
+    def encoded(self, token):
+        # (bytes, mime type), or None for unknown tokens
+        with self._lock:
+            stream = self._streams.get(token)
+
+        if stream is None:
+            return None
+
+        # a player usually opens a few range requests at once; encode once
+        with stream["lock"]:
+            if stream["data"] is None:
+                stream["data"] = encode_audio(stream["amp"], stream["fs"], stream["format"],
+                                              stream["full_scale"])
+                stream["amp"] = None
+
+        return stream["data"], AUDIO_FORMATS[stream["format"]][2]
+
+
+# shared by the sessions and the request handler of the serving process
+AUDIO_STREAMS = AudioStreams()
+
+
+def byte_range(header, size):
+    # (start, stop) of a single "bytes=" range, None for the whole body, or
+    # ValueError when the range cannot be satisfied
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+
+    if match is None:
+        return None
+
+    first, last = match.groups()
+
+    if not first:
+        if not last:
+            return None
+        start, stop = max(size - int(last), 0), size
+    else:
+        start = int(first)
+        stop = min(int(last) + 1, size) if last else size
+
+    if start >= size or start >= stop:
+        raise ValueError(header)
+
+    return start, stop
+
+
+class AudioHandler(tornado.web.RequestHandler):
+
+    async def get(self, token, include_body=True):
+        encoded = await IOLoop.current().run_in_executor(None, AUDIO_STREAMS.encoded, token)
+
+        if encoded is None:
+            raise tornado.web.HTTPError(404)
+
+        data, mime = encoded
+        size = len(data)
+
+        self.set_header("Content-Type", mime)
+        self.set_header("Accept-Ranges", "bytes")
+        self.set_header("Cache-Control", "private, max-age=3600")
+
+        try:
+            requested = byte_range(self.request.headers.get("Range", ""), size)
+        except ValueError:
+            self.set_status(416)
+            self.set_header("Content-Range", f"bytes */{size}")
+            return
+
+        start, stop = requested or (0, size)
+
+        if requested is not None:
+            self.set_status(206)
+            self.set_header("Content-Range", f"bytes {start}-{stop - 1}/{size}")
+
+        self.set_header("Content-Length", stop - start)
+
+        if include_body:
+            self.write(data[start:stop])
+
+    async def head(self, token):
+        await self.get(token, include_body=False)
+
+
+AUDIO_ROUTE = (r"/audio/([\w-]+)", AudioHandler)
+
+
+def audio_url(doc, token):
+    # the audio pane only takes absolute URLs, built from the page request
+    request = doc.session_context.request
+    protocol = request.headers.get("X-Forwarded-Proto", request.protocol)
+    return f"{protocol}://{request.host}/audio/{token}"
@@ -0,0 +1,231 @@
+import argparse
+import glob
+import io
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import soundfile as sf
+
+from scipy.io import wavfile
+
+from equalizer import FFT_OPTIONS, MODE_BANDS, PRECISIONS
+from filterbank import equalize_iir_blocks
+from loaders import COLUMN_FULL_SCALE, RAW_PCM, READERS, full_scale, wav_blocks
+from signal_store import ENGINES
+from streaming import equalize_blocks
+
+
+# engines that can run over a memory-mapped WAV one block at a time
+BLOCK_ENGINES = {
+    "overlap-add": equalize_blocks,
+    "iir": equalize_iir_blocks,
+}
+
+
+def set_fft_workers(workers):
+    FFT_OPTIONS["workers"] = workers
+
+
+def find_inputs(patterns):
+    paths = []
+
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*")
+
+        for path in sorted(glob.glob(pattern)):
+            if os.path.splitext(path)[1][1:].lower() in READERS and path not in paths:
+                paths.append(path)
+
+    return paths
+
+
+def output_paths(paths, output_dir, mode):
+    # {stem}_{mode}.{type} for each input; inputs from different directories
+    # that share a name get their directory's name in front, and a number
+    # when that is not enough, instead of overwriting each other's output
+    outputs = []
+    used = set()
+
+    for path in paths:
+        stem, extension = os.path.splitext(os.path.basename(path))
+        type = extension[1:].lower()
+        name = f"{stem}_{mode}.{type}"
+
+        if name in used:
+            parent = os.path.basename(os.path.dirname(os.path.abspath(path)))
+            name = f"{parent}_{stem}_{mode}.{type}"
+            number = 2
+
+            while name in used:
+                name = f"{parent}_{stem}_{mode}_{number}.{type}"
+                number += 1
+
+        used.add(name)
+        outputs.append(os.path.join(output_dir, name))
+
+    return outputs
+
+
+def load_preset(path):
+    with open(path) as preset_file:
+        preset = json.load(preset_file)
+
+    if isinstance(preset, list):
+        return None, preset
+
+    return preset.get("mode"), preset["gains"]
+
+
+def write_output(path, fs, time, amp, amp_full_scale=COLUMN_FULL_SCALE):
+    # amp is (channels x samples) with a full-scale sample at amp_full_scale,
+    # as the READERS return it; every format keeps full scale at full scale
+    type = os.path.splitext(path)[1][1:].lower()
+    buffer = io.BytesIO()
+
+    if type == "wav":
+        # same float32 encoding the app uses for its audio panes
+        wavfile.write(buffer, fs, (amp.T / amp_full_scale).astype(np.float32))
+
+    elif type in ("csv", "parquet"):
+        columns = ["amp"] if len(amp) == 1 else [f"amp{channel + 1}" for channel in range(len(amp))]
+
+        df = pd.DataFrame(data=amp.T * (COLUMN_FULL_SCALE / amp_full_scale), columns=columns)
+        df.insert(0, "time", np.asarray(time))
+
+        if type == "csv":
+            df.to_csv(buffer, index=False)
+        else:
+            df.to_parquet(buffer, index=False)
+
+    elif type == "npy":
+        np.save(buffer, np.column_stack([time, amp.T * (COLUMN_FULL_SCALE / amp_full_scale)]))
+
+    elif type in ("pcm", "raw"):
+        dtype = np.dtype(RAW_PCM["dtype"])
+        frames = amp.T * (full_scale(dtype) / amp_full_scale)
+
+        if np.issubdtype(dtype, np.unsignedinteger):
+            frames = frames + full_scale(dtype)
+
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            frames = np.clip(np.round(frames), info.min, info.max)
+
+        buffer.write(np.ascontiguousarray(frames, dtype=dtype).tobytes())
+
+    with open(path, "wb") as output_file:
+        output_file.write(buffer.getvalue())
+
+
+def equalize_wav_blocks(path, output_path, mode, gains_db, engine, block_size, dtype):
+    # peak memory stays around a few blocks whatever the file size: the input
+    # is read block by block and the output is appended block by block
+    fs, channels, amp_full_scale, blocks = wav_blocks(path, block_size)
+    n_samples = 0
+
+    with sf.SoundFile(output_path, "w", samplerate=fs, channels=channels, subtype="FLOAT") as output_file:
+        for block in BLOCK_ENGINES[engine](blocks, fs, gains_db, MODE_BANDS[mode], dtype=dtype):
+            output_file.write((block.T / amp_full_scale).astype(np.float32))
+            n_samples += block.shape[-1]
+
+    return n_samples
+
+
+def equalize_file(path, output_path, mode, gains_db, engine, block_size=65536, precision="float32"):
+    start = time.perf_counter()
+
+    type = os.path.splitext(path)[1][1:].lower()
+    dtype = PRECISIONS[precision]
+
+    if type == "wav" and engine in BLOCK_ENGINES:
+        n_samples = equalize_wav_blocks(path, output_path, mode, gains_db, engine, block_size, dtype)
+        return path, output_path, n_samples, time.perf_counter() - start
+
+    with open(path, "rb") as input_file:
+        fs, times, amp, amp_full_scale = READERS[type](input_file.read())
+
+    output = ENGINES[engine](amp, fs, dtype).render(mode, gains_db)
+
+    write_output(output_path, fs, times, output, amp_full_scale)
+
+    return path, output_path, amp.shape[-1], time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Equalize audio and sensor files offline with the same band engine as the app.")
+    parser.add_argument("inputs", nargs="+",
+                        help="files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="equalized")
+    parser.add_argument("-m", "--mode", choices=list(MODE_BANDS))
+    parser.add_argument("-g", "--gains", nargs=10, type=float, metavar="DB",
+                        help="gain of each of the ten bands in dB")
+    parser.add_argument("-p", "--preset",
+                        help="JSON file with ten gains, or {\"mode\": ..., \"gains\": [...]}")
+    parser.add_argument("-e", "--engine", choices=list(ENGINES), default="fft")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--fft-workers", type=int, default=1,
+                        help="threads per FFT in each worker process (-1 = one per CPU)")
+    parser.add_argument("-b", "--block-size", type=int, default=65536,
+                        help="samples per block when WAV files are streamed (overlap-add and iir engines)")
+    parser.add_argument("--precision", choices=list(PRECISIONS), default="float32",
+                        help="sample type of the equalizer; float64 is slower and twice the memory")
+    args = parser.parse_args(argv)
+
+    mode, gains_db = None, [0] * 10
+    if args.preset:
+        mode, gains_db = load_preset(args.preset)
+    if args.gains:
+        gains_db = args.gains
+    mode = args.mode or mode or "default"
+
+    if len(gains_db) != 10:
+        parser.error("exactly ten band gains are needed")
+
+    paths = find_inputs(args.inputs)
+    if not paths:
+        parser.error("no readable files found (" + ", ".join(f".{type}" for type in READERS) + ")")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    total_samples = 0
+    failed = []
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=set_fft_workers,
+                             initargs=(args.fft_workers,)) as executor:
+        futures = [executor.submit(equalize_file, path, output_path, mode, gains_db, args.engine,
+                                   args.block_size, args.precision)
+                   for path, output_path in zip(paths, output_paths(paths, args.output_dir, mode))]
+
+        # one unreadable file should not cost the rest of the run
+        for path, future in zip(paths, futures):
+            try:
+                path, output_path, n_samples, seconds = future.result()
+            except Exception as error:
+                failed.append(path)
+                print(f"{path}: failed: {error!r}", file=sys.stderr)
+                continue
+
+            total_samples += n_samples
+            print(f"{path} -> {output_path}: {n_samples} samples in {seconds:.3f} s")
+
+    elapsed = time.perf_counter() - start
+    done = len(paths) - len(failed)
+
+    print(f"{done} files, {total_samples} samples in {elapsed:.3f} s "
+          f"({done / elapsed:.2f} files/s, {total_samples / elapsed:.0f} samples/s)")
+
+    if failed:
+        parser.exit(1, f"{len(failed)} of {len(paths)} files failed: {', '.join(failed)}\n")
+
+
+if __name__ == "__main__":
+    main()
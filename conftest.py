@@ -0,0 +1 @@
+# lets the tests import the app's modules from the repository root
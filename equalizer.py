@@ -0,0 +1,303 @@
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+from scipy.fft import rfftfreq, rfft, irfft, next_fast_len
+
+
+# (low, high) edges in Hz of the ten slider bands, both ends inclusive
+BANDS = [
+    (20, 40),
+    (41, 80),
+    (81, 160),
+    (161, 320),
+    (321, 640),
+    (641, 1280),
+    (1281, 2560),
+    (2561, 5120),
+    (5121, 10240),
+    (10241, 20000),
+]
+
+MODE_BANDS = {
+    "default": BANDS,
+    "music": BANDS,
+    "vocals": BANDS,
+}
+
+# sample types of the signal path; spectra use the matching complex type
+PRECISIONS = {
+    "float32": np.float32,
+    "float64": np.float64,
+}
+
+# threads used by every forward/inverse transform (-1 = one per CPU); change
+# the entry to retune a running process
+FFT_OPTIONS = {
+    "workers": -1,
+}
+
+# slider gains in dB each mode starts from
+MODE_PRESETS = {
+    "default": [0] * 10,
+    "music": [0] * 10,
+    "vocals": [0] * 10,
+}
+
+
+def db_to_coef(gains_db):
+    return 10 ** (np.asarray(gains_db, dtype=float) / 20)
+
+
+def band_edges(freq, bands=BANDS):
+    # freq is sorted, so every band maps to one contiguous [start, stop) slice
+    # of bins; bands above the nyquist frequency come out empty
+    freq = np.asarray(freq)
+    lows = np.searchsorted(freq, [low for low, _ in bands], side="left")
+    highs = np.searchsorted(freq, [high for _, high in bands], side="right")
+    return np.stack([lows, highs], axis=1)
+
+
+@lru_cache(maxsize=32)
+def fft_plan(n_samples, fs):
+    # transforms are zero-padded to the next 2/3/5-smooth length so that prime
+    # or awkward file lengths do not fall back to Bluestein; returns the
+    # padded length and its number of rfft bins
+    n_fft = next_fast_len(n_samples, real=True)
+    return n_fft, n_fft // 2 + 1
+
+
+@lru_cache(maxsize=128)
+def plan_edges(n_samples, fs, bands):
+    # bands must be a tuple of (low, high) pairs. Bin k sits at k * fs / n_fft,
+    # so the edges follow from the band limits without the bin frequencies,
+    # the same slices band_edges finds in them
+    n_fft, n_bins = fft_plan(n_samples, fs)
+    limits = np.array(bands, dtype=float) * n_fft / fs
+
+    edges = np.stack([np.ceil(limits[:, 0]), np.floor(limits[:, 1]) + 1], axis=1)
+    edges = np.clip(edges, 0, n_bins).astype(np.int64)
+    edges.setflags(write=False)
+    return edges
+
+
+def gain_vector(n_bins, edges, gains_db, dtype=np.float32):
+    # real gains of the signal's precision, so that multiplying a complex64
+    # spectrum does not promote it to complex128
+    gain = np.ones(n_bins, dtype=dtype)
+    for (start, stop), coef in zip(edges, db_to_coef(gains_db)):
+        gain[start:stop] = coef
+    return gain
+
+
+def mask_response(fs, freq, gains_db, bands=BANDS):
+    # gain of the FFT mask at the frequencies freq (sorted)
+    return gain_vector(len(freq), band_edges(freq, bands), gains_db, np.float64)
+
+
+def gain_matrix(n_bins, edges, gains_db, dtype=np.float32):
+    # (settings x 10) gains in dB -> (settings x n_bins) gains
+    coefs = db_to_coef(np.atleast_2d(gains_db))
+
+    gain = np.ones((len(coefs), n_bins), dtype=dtype)
+    for (start, stop), coef in zip(edges, coefs.T):
+        gain[:, start:stop] = coef[:, np.newaxis]
+    return gain
+
+
+def signal_stats(outputs, full_scale=32767):
+    # full_scale is the amplitude of a full-scale sample, as the loaders
+    # report it, so that peak_db/rms_db are in dBFS
+    outputs = np.atleast_2d(outputs)
+
+    peak = np.abs(outputs).max(axis=-1)
+    rms = np.sqrt(np.mean(np.square(outputs), axis=-1))
+
+    return {
+        "peak": peak,
+        "rms": rms,
+        "peak_db": 20 * np.log10(np.maximum(peak, 1e-12) / full_scale),
+        "rms_db": 20 * np.log10(np.maximum(rms, 1e-12) / full_scale),
+    }
+
+
+def equalize(amp, fs, gains_db, bands=BANDS, dtype=np.float32):
+    # amp is one signal or a (signals/channels x samples) array sharing the
+    # same fs; the transform always runs along the last axis
+    amp = np.asarray(amp, dtype=dtype)
+    n_samples = amp.shape[-1]
+    n_fft, n_bins = fft_plan(n_samples, fs)
+
+    data_fft = rfft(amp, n=n_fft, axis=-1, workers=FFT_OPTIONS["workers"])
+    data_fft *= gain_vector(n_bins, plan_edges(n_samples, fs, tuple(bands)), gains_db, dtype)
+
+    output = irfft(data_fft, n=n_fft, axis=-1, overwrite_x=True, workers=FFT_OPTIONS["workers"])
+    return output[..., :n_samples]
+
+
+def precision_error(amp, fs, gains_db, bands=BANDS):
+    # how far the float32 path drifts from the float64 one for a signal,
+    # as (max abs error, error RMS relative to the float64 output RMS)
+    single = equalize(amp, fs, gains_db, bands, np.float32)
+    double = equalize(amp, fs, gains_db, bands, np.float64)
+
+    error = single - double
+    return np.abs(error).max(), np.sqrt(np.mean(error ** 2) / np.mean(double ** 2))
+
+
+class InputSpectrum:
+    # amp may be mono (samples,) or multi-channel (channels x samples); all
+    # channels share the band gains and are transformed in one pass
+
+    def __init__(self, amp, fs, mode_bands=MODE_BANDS, dtype=np.float32):
+        amp = np.asarray(amp, dtype=dtype)
+
+        self.dtype = amp.dtype
+        self.n_samples = amp.shape[-1]
+        self.fs = fs
+        self.n_fft, self.n_bins = fft_plan(self.n_samples, fs)
+        self.spectrum = rfft(amp, n=self.n_fft, axis=-1, workers=FFT_OPTIONS["workers"])
+        self.edges = {mode: plan_edges(self.n_samples, fs, tuple(bands))
+                      for mode, bands in mode_bands.items()}
+
+    @property
+    def freq(self):
+        # built on demand, the renders only need the band edges
+        return rfftfreq(n=self.n_fft, d=1.0/self.fs)
+
+    def gain(self, mode, gains_db):
+        return gain_vector(self.n_bins, self.edges[mode], gains_db, self.dtype)
+
+    def inverse(self, data_fft):
+        # data_fft is always a scratch copy of the spectrum, irfft may reuse
+        # it; the zero padding is trimmed off the output
+        output = irfft(data_fft, n=self.n_fft, axis=-1, overwrite_x=True, workers=FFT_OPTIONS["workers"])
+        return output[..., :self.n_samples]
+
+    def render(self, mode, gains_db):
+        return self.inverse(self.spectrum * self.gain(mode, gains_db))
+
+    def render_batch(self, mode, gains_db, stats=False, chunk_size=None, full_scale=32767):
+        # one output per row of gains_db, shaped (settings, [channels,]
+        # samples); chunk_size bounds the complex temporary for long files
+        gains_db = np.atleast_2d(gains_db)
+        chunk_size = chunk_size or len(gains_db)
+        channel_axes = (1,) * (self.spectrum.ndim - 1)
+
+        outputs = []
+        for start in range(0, len(gains_db), chunk_size):
+            gains = gain_matrix(self.n_bins, self.edges[mode], gains_db[start:start + chunk_size], self.dtype)
+            gains = gains.reshape((len(gains),) + channel_axes + (-1,))
+            outputs.append(self.inverse(self.spectrum * gains))
+
+        outputs = outputs[0] if len(outputs) == 1 else np.concatenate(outputs)
+
+        if stats:
+            return outputs, signal_stats(outputs, full_scale)
+
+        return outputs
+
+
+class IncrementalRenderer:
+    # irfft is linear, so moving one slider only adds (new coef - old coef)
+    # times that band's time-domain component to the current output. The
+    # components of the most recently touched bands are kept, so every step of
+    # a slider drag after the first is a single O(n) multiply-add.
+
+    def __init__(self, spectrum, max_band_signals=2, full_render_every=256):
+        self.spectrum = spectrum
+        self.max_band_signals = max_band_signals
+        self.full_render_every = full_render_every
+
+        self.mode = None
+        self.gains_db = None
+        self.output = None
+        self.n_incremental = 0
+        self.band_signals = OrderedDict()
+
+    def band_signal(self, band):
+        key = (self.mode, band)
+
+        if key in self.band_signals:
+            self.band_signals.move_to_end(key)
+            return self.band_signals[key]
+
+        start, stop = self.spectrum.edges[self.mode][band]
+
+        band_fft = np.zeros_like(self.spectrum.spectrum)
+        band_fft[..., start:stop] = self.spectrum.spectrum[..., start:stop]
+
+        signal = self.spectrum.inverse(band_fft)
+
+        self.band_signals[key] = signal
+        while len(self.band_signals) > self.max_band_signals:
+            self.band_signals.popitem(last=False)
+
+        return signal
+
+    def full_render(self, mode, gains_db):
+        self.mode = mode
+        self.gains_db = gains_db
+        self.output = self.spectrum.render(mode, gains_db)
+        self.n_incremental = 0
+        return self.output
+
+    def render(self, mode, gains_db):
+        gains_db = np.array(gains_db, dtype=float)
+
+        if self.output is None or mode != self.mode or self.n_incremental >= self.full_render_every:
+            return self.full_render(mode, gains_db)
+
+        changed = np.flatnonzero(gains_db != self.gains_db)
+
+        if len(changed) > self.max_band_signals:
+            return self.full_render(mode, gains_db)
+
+        output = self.output
+        for band in changed:
+            # a Python float keeps float32 outputs in float32
+            delta = float(db_to_coef(gains_db[band]) - db_to_coef(self.gains_db[band]))
+            output = output + delta * self.band_signal(band)
+
+        self.gains_db = gains_db
+        self.output = output
+        self.n_incremental += len(changed)
+        return output
+
+
+class Equalizer:
+    # NumPy-only entry point to the FFT band engine, usable without the
+    # Panel app (batch jobs, services, benchmarks)
+
+    def __init__(self, mode_bands=MODE_BANDS, presets=MODE_PRESETS, precision="float32"):
+        self.mode_bands = mode_bands
+        self.presets = presets
+        self.dtype = PRECISIONS[precision]
+
+    @property
+    def modes(self):
+        return list(self.mode_bands)
+
+    def bands(self, mode="default"):
+        return self.mode_bands[mode]
+
+    def preset(self, mode="default"):
+        return list(self.presets[mode])
+
+    def analyze(self, samples, fs):
+        return InputSpectrum(samples, fs, self.mode_bands, self.dtype)
+
+    def apply(self, samples, fs, gains_db=None, mode="default"):
+        if gains_db is None:
+            gains_db = self.preset(mode)
+
+        return equalize(samples, fs, gains_db, self.bands(mode), self.dtype)
+
+    def apply_batch(self, matrix, fs, gains_db=None, mode="default"):
+        return self.apply(np.atleast_2d(matrix), fs, gains_db, mode)
+
+    def apply_settings(self, samples, fs, gains_db, mode="default", stats=False, chunk_size=None,
+                       full_scale=32767):
+        # one signal under many (settings x 10) gain rows, e.g. preset sweeps
+        return self.analyze(samples, fs).render_batch(mode, gains_db, stats, chunk_size, full_scale)
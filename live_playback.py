@@ -0,0 +1,247 @@
+import json
+import secrets
+import threading
+
+import numpy as np
+import tornado.websocket
+
+from equalizer import BANDS
+from filterbank import LiveEqualizer
+
+
+# Live playback streams the input through the IIR filter bank in short blocks
+# over a websocket to an AudioWorklet in the browser, instead of waiting for a
+# full render and a new audio file. The worklet pulls a block whenever fewer
+# than LIVE_OPTIONS["queued_blocks"] are waiting, so what is heard is at most
+# that many blocks behind the sliders, whatever the length of the file.
+
+LIVE_OPTIONS = {
+    "block_ms": 40,
+    "queued_blocks": 3,
+}
+
+
+class LiveStream:
+    # one session's signal and current gains, shared by every connection
+    # that plays it; the playback state is each connection's LivePlayer
+
+    def __init__(self, amp, fs, gains_db, bands=BANDS, full_scale=32767):
+        self.amp = amp
+        self.fs = fs
+        self.full_scale = full_scale
+        self.block_size = max(int(fs * LIVE_OPTIONS["block_ms"] / 1000), 128)
+
+        self._gains = (0, list(gains_db), bands)
+        self._lock = threading.Lock()
+
+    @property
+    def n_channels(self):
+        return len(self.amp)
+
+    def gains(self):
+        # (version, gains_db, bands); the version goes up on every change
+        with self._lock:
+            return self._gains
+
+    def set_gains(self, gains_db, bands=BANDS):
+        with self._lock:
+            self._gains = (self._gains[0] + 1, list(gains_db), bands)
+
+
+class LivePlayer:
+    # one connection's position and filter state, so a reconnect or a second
+    # tab plays the stream from the start without taking the other's blocks
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.position = 0
+        self.version, gains_db, bands = stream.gains()
+        self.equalizer = LiveEqualizer(stream.fs, gains_db, bands, stream.n_channels)
+
+    def next_block(self):
+        # interleaved little-endian float32 frames in [-1, 1], None at the end
+        stream = self.stream
+        version, gains_db, bands = stream.gains()
+
+        if version != self.version:
+            self.version = version
+            self.equalizer.set_gains(gains_db, bands)
+
+        block = stream.amp[:, self.position:self.position + stream.block_size]
+        self.position += stream.block_size
+
+        if block.shape[-1] == 0:
+            return None
+
+        frames = self.equalizer.process(block).T / stream.full_scale
+        return np.ascontiguousarray(frames, dtype="<f4").tobytes()
+
+
+class LiveStreams:
+
+    def __init__(self):
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def register(self, amp, fs, gains_db, bands=BANDS, full_scale=32767):
+        token = secrets.token_urlsafe(16)
+
+        with self._lock:
+            self._streams[token] = LiveStream(amp, fs, gains_db, bands, full_scale)
+
+        return token
+
+    def get(self, token):
+        with self._lock:
+            return self._streams.get(token)
+
+    def discard(self, token):
+        with self._lock:
+            self._streams.pop(token, None)
+
+    def set_gains(self, token, gains_db, bands=BANDS):
+        stream = self.get(token)
+
+        if stream is not None:
+            stream.set_gains(gains_db, bands)
+
+
+LIVE_STREAMS = LiveStreams()
+
+
+class LiveHandler(tornado.websocket.WebSocketHandler):
+    # text "pull" from the browser -> one binary block back; the first
+    # message tells the browser how to play the blocks
+
+    def open(self, token):
+        stream = LIVE_STREAMS.get(token)
+        self.player = None
+
+        if stream is None:
+            self.close(4004, "unknown stream")
+            return
+
+        self.player = LivePlayer(stream)
+        self.write_message(json.dumps({
+            "fs": stream.fs,
+            "channels": stream.n_channels,
+            "queued_blocks": LIVE_OPTIONS["queued_blocks"],
+        }))
+
+    def on_message(self, message):
+        if message != "pull" or self.player is None:
+            return
+
+        data = self.player.next_block()
+
+        if data is None:
+            self.write_message(json.dumps({"end": True}))
+        else:
+            self.write_message(data, binary=True)
+
+
+LIVE_ROUTE = (r"/live/([\w-]+)", LiveHandler)
+
+
+def live_url(doc, token):
+    request = doc.session_context.request
+    protocol = request.headers.get("X-Forwarded-Proto", request.protocol)
+    return f"{'wss' if protocol == 'https' else 'ws'}://{request.host}/live/{token}"
+
+
+# AudioWorklet that plays the interleaved blocks and asks for more
+LIVE_PROCESSOR_JS = """
+class LiveEqualizerProcessor extends AudioWorkletProcessor {
+  constructor(options) {
+    super()
+    this.channels = options.processorOptions.channels
+    this.queued = options.processorOptions.queued_blocks
+    this.blocks = []
+    this.offset = 0
+    this.requested = 0
+    this.port.onmessage = (event) => {
+      this.blocks.push(event.data)
+      this.requested -= 1
+    }
+  }
+
+  process(inputs, outputs) {
+    const output = outputs[0]
+    const frames = output[0].length
+    let written = 0
+
+    while (written < frames && this.blocks.length) {
+      const block = this.blocks[0]
+      const n = Math.min(block.length / this.channels - this.offset, frames - written)
+
+      for (let channel = 0; channel < output.length; channel++) {
+        for (let i = 0; i < n; i++) {
+          output[channel][written + i] = block[(this.offset + i) * this.channels + channel]
+        }
+      }
+
+      written += n
+      this.offset += n
+
+      if (this.offset * this.channels >= block.length) {
+        this.blocks.shift()
+        this.offset = 0
+      }
+    }
+
+    while (this.blocks.length + this.requested < this.queued) {
+      this.port.postMessage("pull")
+      this.requested += 1
+    }
+
+    return true
+  }
+}
+
+registerProcessor("live-equalizer", LiveEqualizerProcessor)
+"""
+
+# jscallback of the live playback toggle; `source` is the toggle and `url`
+# the hidden input holding the stream's websocket URL
+LIVE_TOGGLE_JS = """
+const live = window._equalizer_live || (window._equalizer_live = {})
+
+if (live.socket) { live.socket.close() }
+if (live.context) { live.context.close() }
+live.socket = live.context = null
+
+if (source.active && url.value) {
+  const socket = new WebSocket(url.value)
+  socket.binaryType = "arraybuffer"
+
+  socket.onmessage = async (event) => {
+    if (typeof event.data !== "string") {
+      live.node.port.postMessage(new Float32Array(event.data), [event.data])
+      return
+    }
+
+    const info = JSON.parse(event.data)
+
+    if (info.end) {
+      socket.close()
+      return
+    }
+
+    const context = new AudioContext({sampleRate: info.fs})
+    const module = new Blob([PROCESSOR], {type: "application/javascript"})
+    await context.audioWorklet.addModule(URL.createObjectURL(module))
+
+    const node = new AudioWorkletNode(context, "live-equalizer", {
+      outputChannelCount: [info.channels],
+      processorOptions: {channels: info.channels, queued_blocks: info.queued_blocks},
+    })
+    node.port.onmessage = () => socket.send("pull")
+    node.connect(context.destination)
+
+    live.context = context
+    live.node = node
+  }
+
+  live.socket = socket
+}
+""".replace("PROCESSOR", json.dumps(LIVE_PROCESSOR_JS))
@@ -0,0 +1,320 @@
+import io
+import struct
+
+import numpy as np
+import pandas as pd
+import soundfile as sf
+
+from scipy.io import wavfile
+
+try:
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa_csv = None
+
+
+# every reader takes the uploaded bytes and returns (fs, time, amp, full_scale)
+# with time a SampleTimes, amp a (channels x samples) float32 array, mono
+# files included, and full_scale the amplitude of a full-scale sample in
+# amp's units. CSV, .npy and
+# .parquet files hold a time column followed by one column per channel, in
+# 16-bit units like the app has always shown them.
+
+COLUMN_FULL_SCALE = 32767.0
+
+# layout of headerless .pcm/.raw uploads
+RAW_PCM = {
+    "fs": 44100,
+    "channels": 1,
+    "dtype": "<i2",
+}
+
+
+class SampleTimes:
+    # The time of every sample of a signal without keeping a float64 per
+    # sample, which for mono is twice the float32 samples themselves: evenly
+    # sampled signals are start + index * step, only column uploads whose
+    # time column is not uniform keep it as an array. Indexes, slices and
+    # searchsorted like the array it stands for.
+
+    dtype = np.dtype(np.float64)
+
+    def __init__(self, n_samples, step, start=0.0, times=None):
+        self.n_samples = n_samples
+        self.step = step
+        self.start = start
+        self.times = times
+
+    @classmethod
+    def of(cls, times, rtol=1e-6):
+        times = np.asarray(times, dtype=float)
+        n_samples = len(times)
+
+        if n_samples < 2:
+            return cls(n_samples, 1.0, times[0] if n_samples else 0.0)
+
+        step = (times[-1] - times[0]) / (n_samples - 1)
+
+        if np.allclose(np.diff(times), step, rtol=rtol, atol=0):
+            return cls(n_samples, step, times[0])
+
+        times.setflags(write=False)
+        return cls(n_samples, step, times[0], times)
+
+    def __len__(self):
+        return self.n_samples
+
+    @property
+    def nbytes(self):
+        return 0 if self.times is None else self.times.nbytes
+
+    def __getitem__(self, index):
+        if self.times is not None:
+            return self.times[index]
+
+        if isinstance(index, slice):
+            return self.start + np.arange(*index.indices(self.n_samples)) * self.step
+
+        index = np.asarray(index)
+        return self.start + np.where(index < 0, index + self.n_samples, index) * self.step
+
+    def searchsorted(self, value, side="left"):
+        if self.times is not None:
+            return self.times.searchsorted(value, side)
+
+        # times that fall on a sample only miss it by rounding
+        position = (value - self.start) / self.step
+        nearest = np.round(position)
+        if abs(position - nearest) <= 1e-9 * max(abs(nearest), 1):
+            position = nearest
+
+        index = np.ceil(position) if side == "left" else np.floor(position) + 1
+        return int(np.clip(index, 0, self.n_samples))
+
+    def __array__(self, dtype=None):
+        array = self[:]
+        return array if dtype is None else array.astype(dtype)
+
+
+def sample_times(n_samples, fs):
+    return SampleTimes(n_samples, 1.0 / fs)
+
+
+def full_scale(dtype):
+    # float samples are in [-1, 1]; unsigned ones are centred on zero by
+    # to_samples, which leaves them half their range
+    dtype = np.dtype(dtype)
+
+    if np.issubdtype(dtype, np.floating):
+        return 1.0
+    if np.issubdtype(dtype, np.unsignedinteger):
+        return float(2 ** (dtype.itemsize * 8 - 1))
+
+    return float(np.iinfo(dtype).max)
+
+
+def to_samples(frames):
+    # C-ordered float32 copy of integer or float samples, centred on zero;
+    # frames is usually a transposed (samples x channels) view, and keeping
+    # its layout would make every per-channel access strided
+    amp = frames.astype(np.float32, order="C")
+
+    if np.issubdtype(frames.dtype, np.unsignedinteger):
+        amp -= np.float32(full_scale(frames.dtype))
+
+    return amp
+
+
+def from_columns(columns):
+    if columns.ndim != 2 or columns.shape[1] < 2:
+        raise ValueError("expected a time column and at least one amplitude column")
+    if len(columns) < 2:
+        raise ValueError("at least two rows are needed to find the sample rate")
+
+    times = np.asarray(columns[:, 0], dtype=float)
+    if not np.all(np.diff(times) > 0):
+        raise ValueError("the time column must be increasing")
+
+    n_measurements = len(times)
+    timespan_seconds = times[-1] - times[0]
+    sample_rate_hz = int(n_measurements / timespan_seconds)
+    if sample_rate_hz < 1:
+        raise ValueError("the time column spans less than one sample per second")
+
+    amp = np.ascontiguousarray(columns[:, 1:].T, dtype=np.float32)
+
+    return sample_rate_hz, SampleTimes.of(times), amp, COLUMN_FULL_SCALE
+
+
+WAV_DTYPES = {
+    (1, 8): "u1",
+    (1, 16): "<i2",
+    (1, 32): "<i4",
+    (3, 32): "<f4",
+    (3, 64): "<f8",
+}
+
+
+def checked_frames(fs, frames):
+    # the engines cannot do anything with an empty signal or a zero rate
+    if fs <= 0:
+        raise ValueError("the sample rate must be positive")
+    if frames.size == 0:
+        raise ValueError("no samples in the file")
+
+    return fs, frames
+
+
+def wav_frames(data):
+    # (fs, frames) where frames is a (samples x channels) view on the PCM
+    # chunk of the bytes, without copying or decoding anything
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise ValueError("not a RIFF/WAVE file")
+
+    fmt = None
+    offset = 12
+
+    while offset + 8 <= len(data):
+        chunk_id, size = struct.unpack_from("<4sI", data, offset)
+        offset += 8
+
+        if chunk_id == b"fmt ":
+            if offset + 16 > len(data):
+                raise ValueError("truncated WAV fmt chunk")
+
+            fmt = struct.unpack_from("<HHIIHH", data, offset)
+            if fmt[0] == 0xFFFE:
+                if offset + 26 > len(data):
+                    raise ValueError("truncated WAV fmt chunk")
+                # WAVE_FORMAT_EXTENSIBLE keeps the real format in the sub-format GUID
+                fmt = (struct.unpack_from("<H", data, offset + 24)[0],) + fmt[1:]
+
+        elif chunk_id == b"data" and fmt is not None:
+            format_tag, channels, fs, _, _, bits = fmt
+            dtype = WAV_DTYPES.get((format_tag, bits))
+
+            if dtype is None:
+                break
+            if channels == 0:
+                raise ValueError("WAV fmt chunk declares no channels")
+
+            size = min(size, len(data) - offset)
+            frames = np.frombuffer(data, dtype=dtype, count=size // (bits // 8), offset=offset)
+
+            return checked_frames(fs, frames[:len(frames) // channels * channels].reshape(-1, channels))
+
+        offset += size + (size & 1)
+
+    # 24-bit and other layouts go through scipy, which copies; what it
+    # raises on broken files ranges from struct.error to UnboundLocalError
+    try:
+        fs, frames = wavfile.read(io.BytesIO(data))
+        frames = frames.reshape(len(frames), -1)
+    except Exception as error:
+        raise ValueError(f"unreadable WAV file: {error!r}") from error
+
+    return checked_frames(fs, frames)
+
+
+def open_wav(path):
+    # memory-mapped (samples x channels) frames of a WAV file on disk; pages
+    # are only read when a block of them is used
+    fs, frames = wavfile.read(path, mmap=True)
+    return fs, frames.reshape(len(frames), -1)
+
+
+def frame_blocks(frames, block_size=65536):
+    # (channels x block) float32 blocks of (samples x channels) frames
+    for start in range(0, len(frames), block_size):
+        yield to_samples(frames[start:start + block_size].T)
+
+
+def wav_blocks(path, block_size=65536):
+    # (fs, channels, full_scale, blocks) of a WAV file on disk, read one
+    # block at a time. scipy cannot memory-map 3-byte samples, so 24-bit
+    # files are read through libsndfile instead, as int32 like scipy does.
+    try:
+        fs, frames = open_wav(path)
+    except ValueError:
+        info = sf.info(path)
+        blocks = (to_samples(block.T) for block in
+                  sf.blocks(path, blocksize=block_size, dtype="int32", always_2d=True))
+
+        return info.samplerate, info.channels, full_scale(np.int32), blocks
+
+    return fs, frames.shape[1], full_scale(frames.dtype), frame_blocks(frames, block_size)
+
+
+def read_wav(data):
+    fs, frames = wav_frames(data)
+
+    amp = to_samples(frames.T)
+
+    return fs, sample_times(amp.shape[-1], fs), amp, full_scale(frames.dtype)
+
+
+def read_csv(data):
+    # parsed straight from the upload bytes, without a text decode or a
+    # DataFrame round trip when pyarrow is around
+    if pa_csv is not None:
+        table = pa_csv.read_csv(io.BytesIO(data))
+        columns = np.column_stack([column.to_numpy() for column in table.columns])
+    else:
+        columns = pd.read_csv(io.BytesIO(data), index_col=False, header=0,
+                              dtype=np.float64, engine="c").to_numpy()
+
+    return from_columns(columns)
+
+
+def read_npy(data):
+    # the array is a view on the upload bytes; only the float32 channel
+    # block is copied out of it. A 1-D array is mono samples at RAW_PCM["fs"].
+    buffer = io.BytesIO(data)
+    version = np.lib.format.read_magic(buffer)
+    read_header = {
+        (1, 0): np.lib.format.read_array_header_1_0,
+        (2, 0): np.lib.format.read_array_header_2_0,
+    }.get(version)
+
+    if read_header is None:
+        columns = np.load(io.BytesIO(data))
+    else:
+        shape, fortran_order, dtype = read_header(buffer)
+        columns = np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)), offset=buffer.tell())
+        columns = columns.reshape(shape, order="F" if fortran_order else "C")
+
+    if columns.ndim == 1:
+        fs, columns = checked_frames(RAW_PCM["fs"], columns)
+        return fs, sample_times(len(columns), fs), to_samples(columns)[np.newaxis], full_scale(columns.dtype)
+
+    return from_columns(columns)
+
+
+def read_parquet(data):
+    return from_columns(pd.read_parquet(io.BytesIO(data)).to_numpy(dtype=np.float64))
+
+
+def read_pcm(data, fs=None, channels=None, dtype=None):
+    fs = fs or RAW_PCM["fs"]
+    channels = channels or RAW_PCM["channels"]
+    dtype = np.dtype(dtype or RAW_PCM["dtype"])
+
+    frames = len(data) // (dtype.itemsize * channels)
+    amp = np.frombuffer(data, dtype=dtype, count=frames * channels)
+    fs, amp = checked_frames(fs, amp.reshape(frames, channels).T)
+
+    # no copy at all for little-endian float32 captures
+    if amp.dtype != np.float32 or not amp.flags.c_contiguous:
+        amp = np.ascontiguousarray(to_samples(amp))
+
+    return fs, sample_times(frames, fs), amp, full_scale(dtype)
+
+
+READERS = {
+    "wav": read_wav,
+    "csv": read_csv,
+    "npy": read_npy,
+    "parquet": read_parquet,
+    "pcm": read_pcm,
+    "raw": read_pcm,
+}
@@ -0,0 +1,238 @@
+import multiprocessing
+import threading
+import weakref
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from equalizer import FFT_OPTIONS
+from signal_store import ENGINES
+
+
+# Renders can run in a pool of worker processes instead of the serving
+# process, so that one session's FFTs do not hold the GIL while the others
+# wait. Signals never go through pickle: the input samples are copied once
+# into a shared memory block that every worker maps, and each renderer has
+# its own output block the worker writes into. Only block names, shapes and
+# gains cross the process boundary.
+#
+# Every input block is always rendered by the same worker, the one with the
+# fewest blocks when it was shared, so a file's renderer (for the fft engine,
+# its whole input spectrum) is built and cached in one worker rather than in
+# each of them.
+
+POOL_OPTIONS = {
+    # worker processes; 0 renders in the serving process as before
+    "workers": 0,
+    # FFT threads per worker process
+    "fft_workers": 1,
+    # bytes of renderers each worker keeps around (input spectra are the bulk
+    # of it); the most recently used one is always kept
+    "cache_bytes": 512 * 2**20,
+}
+
+
+class SharedArray:
+    # a NumPy array in a named shared memory block; `spec` is what another
+    # process needs to map it
+
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+        nbytes = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=nbytes)
+
+        # the creator removes the block once nobody refers to it any more
+        if name is None:
+            weakref.finalize(self, unlink, self.shm)
+
+    @classmethod
+    def copy_of(cls, array):
+        shared = cls(array.shape, array.dtype)
+        shared.array()[...] = array
+        return shared
+
+    @property
+    def spec(self):
+        return self.shm.name, self.shape, self.dtype.str
+
+    def array(self):
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+
+
+def unlink(shm):
+    shm.close()
+    shm.unlink()
+
+
+# state of a worker process: key -> [mapped input, renderer, nbytes]
+_worker_renderers = OrderedDict()
+
+
+def init_worker(fft_workers, cache_bytes):
+    # spawned workers import this module afresh, without the server's options
+    FFT_OPTIONS["workers"] = fft_workers
+    POOL_OPTIONS["cache_bytes"] = cache_bytes
+
+
+def renderer_nbytes(renderer, amp):
+    # the arrays a renderer holds besides the mapped input samples amp
+    arrays = [value for value in vars(renderer).values() if isinstance(value, np.ndarray)]
+    arrays += list(getattr(renderer, "band_signals", {}).values())
+
+    spectrum = getattr(renderer, "spectrum", None)
+    if spectrum is not None:
+        arrays.append(spectrum.spectrum)
+
+    return sum(array.nbytes for array in arrays if not np.may_share_memory(array, amp))
+
+
+def trim_worker_renderers():
+    total = sum(entry[2] for entry in _worker_renderers.values())
+
+    while total > POOL_OPTIONS["cache_bytes"] and len(_worker_renderers) > 1:
+        total -= _worker_renderers.popitem(last=False)[1][2]
+
+
+def worker_renderer(input_spec, fs, engine, dtype):
+    key = (input_spec[0], engine, dtype)
+
+    if key in _worker_renderers:
+        _worker_renderers.move_to_end(key)
+        return _worker_renderers[key][1]
+
+    name, shape, input_dtype = input_spec
+    shared = SharedArray(shape, input_dtype, name)
+    amp = shared.array()
+
+    renderer = ENGINES[engine](amp, fs, np.dtype(dtype).type)
+
+    # the mapping stays open as long as the renderer that reads from it
+    _worker_renderers[key] = [shared, renderer, renderer_nbytes(renderer, amp)]
+    trim_worker_renderers()
+
+    return renderer
+
+
+def render_shared(input_spec, output_spec, fs, engine, dtype, mode, gains_db):
+    renderer = worker_renderer(input_spec, fs, engine, dtype)
+    output = renderer.render(mode, gains_db)
+
+    # renderers grow as they render (outputs, cached band signals)
+    entry = _worker_renderers[(input_spec[0], engine, dtype)]
+    entry[2] = renderer_nbytes(renderer, entry[0].array())
+    trim_worker_renderers()
+
+    shared = SharedArray(output_spec[1], output_spec[2], output_spec[0])
+    shared.array()[...] = output
+    shared.shm.close()
+
+
+class RemoteRenderer:
+    # drop-in for the in-process renderers, for a signal mapped by the pool
+
+    def __init__(self, pool, signal, engine, dtype):
+        self.pool = pool
+        self.signal = signal
+        self.engine = engine
+        self.dtype = np.dtype(dtype)
+
+        self.input = pool.share(signal)
+        self.output = SharedArray(signal.amp.shape, self.dtype)
+
+    def render(self, mode, gains_db):
+        # blocks the calling (render scheduler) thread only; the copy out of
+        # the block is the one the in-process renderers would not need
+        self.pool.run(
+            self.input.spec[0], render_shared, self.input.spec, self.output.spec, self.signal.fs,
+            self.engine, self.dtype.str, mode, [float(gain) for gain in gains_db])
+
+        return self.output.array().copy()
+
+
+class RenderPool:
+
+    def __init__(self, workers, fft_workers=1):
+        self.fft_workers = fft_workers
+        # one single-process executor per worker, so renders can be sent to
+        # a given worker
+        self.executors = [self._start() for _ in range(workers)]
+
+        # input block name -> index of the worker that renders it
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def _start(self):
+        # spawned rather than forked, the serving process runs an event loop
+        # and a thread per session scheduler
+        return ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker, initargs=(self.fft_workers, POOL_OPTIONS["cache_bytes"]))
+
+    def worker(self, name):
+        return self._workers[name]
+
+    def _assign(self, shared):
+        # called under the lock; the assignment goes with the block
+        loads = [0] * len(self.executors)
+        for index in self._workers.values():
+            loads[index] += 1
+
+        name = shared.spec[0]
+        self._workers[name] = loads.index(min(loads))
+        weakref.finalize(shared, self._workers.pop, name, None)
+
+    def restart(self, index, broken):
+        # replaces the worker's executor if it is still the broken one;
+        # sessions that hit the same dead worker at once only start one
+        with self._lock:
+            if self.executors[index] is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self.executors[index] = self._start()
+
+            return self.executors[index]
+
+    def run(self, name, fn, *args):
+        # runs fn on the worker of the input block called name. A worker that
+        # dies (killed, out of memory) breaks its executor for every later
+        # submit, so a broken one is replaced and the call retried once
+        index = self.worker(name)
+        executor = self.executors[index]
+
+        try:
+            return executor.submit(fn, *args).result()
+        except BrokenProcessPool:
+            return self.restart(index, executor).submit(fn, *args).result()
+
+    def share(self, signal):
+        # one input block per shared signal, released with it
+        with self._lock:
+            if signal.shared_input is None:
+                signal.shared_input = SharedArray.copy_of(signal.amp)
+                self._assign(signal.shared_input)
+
+            return signal.shared_input
+
+    def renderer(self, signal, engine, dtype):
+        return RemoteRenderer(self, signal, engine, dtype)
+
+    def close(self):
+        for executor in self.executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = {"pool": None}
+
+
+def render_pool():
+    # the process-wide pool, started on first use when POOL_OPTIONS asks
+    # for worker processes
+    if _pool["pool"] is None and POOL_OPTIONS["workers"] > 0:
+        _pool["pool"] = RenderPool(POOL_OPTIONS["workers"], POOL_OPTIONS["fft_workers"])
+
+    return _pool["pool"]
@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class RenderScheduler:
+    # Runs `render(request)` on a worker thread. Requests that arrive while a
+    # render is pending replace it, a render only starts once the requests have
+    # been quiet for `debounce` seconds (or `max_wait` passed since the first
+    # one), and results that were overtaken by a newer request are discarded
+    # instead of being handed to `on_result`.
+
+    def __init__(self, render, on_result, debounce=0.05, max_wait=0.25):
+        self.render = render
+        self.on_result = on_result
+        self.debounce = debounce
+        self.max_wait = max_wait
+
+        self.stats = {"queued": 0, "dropped": 0, "completed": 0}
+
+        self._cond = threading.Condition()
+        self._pending = None
+        self._generation = 0
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, request):
+        with self._cond:
+            if self._pending is not None:
+                self.stats["dropped"] += 1
+
+            self._pending = request
+            self._generation += 1
+            self.stats["queued"] += 1
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def _next_request(self):
+        with self._cond:
+            while self._pending is None and not self._closed:
+                self._cond.wait()
+
+            first_seen = time.monotonic()
+            while not self._closed:
+                generation = self._generation
+                remaining = self.max_wait - (time.monotonic() - first_seen)
+                self._cond.wait(min(self.debounce, max(remaining, 0)))
+
+                if generation == self._generation or remaining <= 0:
+                    break
+
+            if self._closed:
+                return None, None
+
+            request = self._pending
+            self._pending = None
+            return request, self._generation
+
+    def _run(self):
+        while True:
+            request, generation = self._next_request()
+
+            if request is None:
+                return
+
+            try:
+                result = self.render(request)
+            except Exception:
+                logger.exception("render failed")
+                continue
+
+            with self._cond:
+                if generation != self._generation:
+                    self.stats["dropped"] += 1
+                    continue
+
+                self.stats["completed"] += 1
+
+            try:
+                self.on_result(result)
+            except Exception:
+                logger.exception("delivering render result failed")
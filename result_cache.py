@@ -0,0 +1,88 @@
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_key(amp, fs):
+    # identifies a decoded signal by its samples, whatever file it came from
+    amp = np.ascontiguousarray(amp)
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{fs}:{amp.dtype.str}:{amp.shape}".encode())
+    digest.update(memoryview(amp).cast("B"))
+
+    return digest.hexdigest()
+
+
+def quantize_gains(gains_db, step=0.1):
+    # slider positions that round to the same step share one result
+    return tuple(int(round(gain / step)) for gain in gains_db)
+
+
+class ResultCache:
+    # Least recently used results (rendered outputs, their waveform pyramids,
+    # output spectrograms) bounded by their total size in bytes. Values are
+    # shared with whoever asked for them, so arrays are made read-only when
+    # they are stored. Used from the render thread and the session thread.
+
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return self._entries[key][0]
+
+    def put(self, key, value, nbytes):
+        for array in value if isinstance(value, tuple) else (value,):
+            if isinstance(array, np.ndarray):
+                array.setflags(write=False)
+
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+
+            # a single result larger than the whole budget is not kept
+            if nbytes > self.max_bytes:
+                return value
+
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_bytes
+                self.stats["evictions"] += 1
+
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def report(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), nbytes=self.nbytes)
+
+
+# keys start with the content hash of the input, so the sessions served by one
+# process can share a cache without seeing each other's files
+RESULT_CACHE = ResultCache()
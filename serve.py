@@ -0,0 +1,41 @@
+import argparse
+import os
+
+import panel as pn
+
+from audio_server import AUDIO_FORMATS, AUDIO_OPTIONS, AUDIO_ROUTE
+from live_playback import LIVE_ROUTE
+from render_pool import POOL_OPTIONS
+
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve the equalizer app, optionally rendering in worker processes.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--address")
+    parser.add_argument("--allow-websocket-origin", action="append",
+                        help="host[:port] the app may be embedded from (repeatable)")
+    parser.add_argument("-w", "--render-workers", type=int, default=os.cpu_count(),
+                        help="worker processes for renders, 0 to render in the server process")
+    parser.add_argument("--fft-workers", type=int, default=1,
+                        help="threads per FFT in each render worker (-1 = one per CPU)")
+    parser.add_argument("--audio-format", choices=list(AUDIO_FORMATS), default="wav",
+                        help="encoding of the audio players' streams")
+    args = parser.parse_args(argv)
+
+    POOL_OPTIONS["workers"] = args.render_workers
+    POOL_OPTIONS["fft_workers"] = args.fft_workers
+
+    AUDIO_OPTIONS["format"] = args.audio_format
+    AUDIO_OPTIONS["served"] = True
+
+    pn.serve({"app": APP}, port=args.port, address=args.address,
+             websocket_origin=args.allow_websocket_origin, show=False, title="Equalizer",
+             extra_patterns=[AUDIO_ROUTE, LIVE_ROUTE])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+import numpy as np
+
+from equalizer import MODE_BANDS, InputSpectrum
+from spectrogram import Spectrogram
+from waveform import channel_view
+
+
+def upload_key(data, type):
+    # uploads with the same bytes decode to the same signal, so they are
+    # recognised before any decoding happens
+    digest = hashlib.blake2b(type.encode(), digest_size=16)
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+class SharedSignal:
+    # One decoded signal and everything derived from it that does not depend
+    # on a session's sliders: the input spectrum per precision and the input
+    # STFT per channel view. All arrays are read-only, sessions only ever
+    # derive new arrays from them.
+
+    def __init__(self, key, fs, time, amp, full_scale=32767):
+        self.key = key
+        self.fs = fs
+        self.full_scale = full_scale
+        # a loaders.SampleTimes, which only holds an array for uneven uploads
+        self.time = time
+        self.amp = read_only(np.asarray(amp))
+        self.refs = 0
+
+        # the samples' shared memory copy, made by a render pool when needed
+        self.shared_input = None
+
+        self.spectra = {}
+        self.spectrograms = {}
+
+    @property
+    def nbytes(self):
+        return (self.time.nbytes + self.amp.nbytes
+                + sum(spectrum.spectrum.nbytes for spectrum in self.spectra.values())
+                + sum(spectrogram.power.nbytes for spectrogram in self.spectrograms.values()))
+
+
+class SharedSignals:
+    # Process-wide store of decoded uploads keyed by content hash, so that
+    # sessions loading the same track share one copy of its samples, spectrum
+    # and STFT. Signals still referenced by a session are never evicted;
+    # released ones stay around for the next upload of the same file until
+    # the total goes over max_bytes, oldest first.
+
+    def __init__(self, max_bytes=1024 * 2**20):
+        self.max_bytes = max_bytes
+
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+        self._signals = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(signal.nbytes for signal in self._signals.values())
+
+    def acquire(self, key, decode):
+        # decode() -> (fs, time, amp, full_scale) only runs when the key is unknown
+        with self._lock:
+            signal = self._signals.get(key)
+
+            if signal is not None:
+                self._signals.move_to_end(key)
+                self.stats["hits"] += 1
+                signal.refs += 1
+                return signal
+
+        fs, time, amp, full_scale = decode()
+
+        with self._lock:
+            # another session may have decoded the same upload meanwhile
+            signal = self._signals.setdefault(key, SharedSignal(key, fs, time, amp, full_scale))
+            self.stats["misses"] += 1
+            signal.refs += 1
+            self._trim()
+
+        return signal
+
+    def release(self, signal):
+        with self._lock:
+            signal.refs -= 1
+            self._trim()
+
+    def spectrum(self, signal, dtype, mode_bands=MODE_BANDS):
+        key = np.dtype(dtype).name
+
+        if key not in signal.spectra:
+            spectrum = InputSpectrum(signal.amp, signal.fs, mode_bands, dtype)
+            read_only(spectrum.spectrum)
+
+            with self._lock:
+                spectrum = signal.spectra.setdefault(key, spectrum)
+                self._trim()
+
+        return signal.spectra[key]
+
+    def spectrogram(self, signal, view):
+        if view not in signal.spectrograms:
+            spectrogram = Spectrogram(channel_view(signal.amp, view), signal.fs)
+            read_only(spectrogram.power)
+
+            with self._lock:
+                signal.spectrograms.setdefault(view, spectrogram)
+                self._trim()
+
+        return signal.spectrograms[view]
+
+    def _trim(self):
+        total = sum(signal.nbytes for signal in self._signals.values())
+
+        for key in list(self._signals):
+            if total <= self.max_bytes:
+                break
+
+            signal = self._signals[key]
+            if signal.refs > 0:
+                continue
+
+            total -= signal.nbytes
+            del self._signals[key]
+            self.stats["evictions"] += 1
+
+    def report(self):
+        with self._lock:
+            return dict(self.stats, signals=len(self._signals),
+                        referenced=sum(signal.refs > 0 for signal in self._signals.values()),
+                        nbytes=sum(signal.nbytes for signal in self._signals.values()))
+
+
+# module state is shared by every session `panel serve` runs in this process
+SHARED_SIGNALS = SharedSignals()
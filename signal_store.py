@@ -0,0 +1,159 @@
+from functools import partial
+
+import numpy as np
+
+from equalizer import MODE_BANDS, PRECISIONS, InputSpectrum, IncrementalRenderer, mask_response
+from filterbank import FilterBankRenderer, band_response
+from loaders import READERS, SampleTimes
+from result_cache import RESULT_CACHE, content_key, quantize_gains
+from shared_signals import SHARED_SIGNALS, upload_key
+from streaming import OverlapAddRenderer, fir_response
+from waveform import WaveformPyramid, channel_view
+
+
+# every engine is built as engine(amp, fs, dtype) and renders in that dtype
+ENGINES = {
+    "fft": lambda amp, fs, dtype: IncrementalRenderer(InputSpectrum(amp, fs, MODE_BANDS, dtype)),
+    "overlap-add": lambda amp, fs, dtype: OverlapAddRenderer(amp, fs, dtype=dtype),
+    "iir": lambda amp, fs, dtype: FilterBankRenderer(amp, fs, dtype=dtype),
+}
+
+# the magnitude response of every engine as response(fs, freq, gains_db, bands)
+RESPONSES = {
+    "fft": mask_response,
+    "overlap-add": fir_response,
+    "iir": band_response,
+}
+
+
+class SignalStore:
+    # Everything one session knows about its upload, kept in memory so that
+    # sessions served by the same process never share files on disk. Signals
+    # are (channels x samples); the pyramids and spectrogram belong to the
+    # channel view being plotted. The decoded samples, the fft engine's input
+    # spectrum and the input spectrogram are read-only and held by `shared`,
+    # which hands the same copy to every session that loads the same content.
+    # With a render pool the engines run in its worker processes instead.
+
+    def __init__(self, precision="float32", results=RESULT_CACHE, shared=SHARED_SIGNALS, pool=None):
+        self.dtype = PRECISIONS[precision]
+        self.results = results
+        self.shared = shared
+        self.pool = pool
+        self.signal = None
+        self.clear()
+
+    def clear(self):
+        if self.signal is not None:
+            self.shared.release(self.signal)
+
+        self.signal = None
+        self.filename = None
+        self.key = None
+        self.fs = None
+        self.full_scale = None
+        self.time = None
+        self.amp = None
+        self.renderers = {}
+        self.output = None
+        self.view = "mix"
+        self.input_pyramid = None
+        self.output_pyramid = None
+        self.input_spectrogram = None
+
+    @property
+    def loaded(self):
+        return self.amp is not None
+
+    @property
+    def n_channels(self):
+        return 0 if self.amp is None else len(self.amp)
+
+    def open(self, filename, type, data):
+        # decodes the upload bytes unless a session already did; raises like
+        # the READERS do
+        self.attach(filename, self.shared.acquire(
+            upload_key(data, type), partial(READERS[type], data)))
+
+    def load(self, filename, fs, time, amp, full_scale=32767):
+        # time may be None for evenly sampled signals starting at 0
+        if not isinstance(time, SampleTimes):
+            time = SampleTimes(np.shape(amp)[-1], 1.0 / fs) if time is None else SampleTimes.of(time)
+
+        self.attach(filename, self.shared.acquire(
+            content_key(amp, fs), lambda: (fs, time, amp, full_scale)))
+
+    def attach(self, filename, signal):
+        self.clear()
+
+        self.signal = signal
+        self.filename = filename
+        self.key = signal.key
+        self.fs = signal.fs
+        self.full_scale = signal.full_scale
+        self.time = signal.time
+        self.amp = signal.amp
+        self.renderers = {"fft": self.build("fft")}
+        self.input_pyramid = WaveformPyramid(channel_view(self.amp))
+        self.set_output(self.amp, self.input_pyramid)
+
+    def build(self, engine):
+        if self.pool is not None:
+            return self.pool.renderer(self.signal, engine, self.dtype)
+
+        if engine == "fft":
+            return IncrementalRenderer(self.shared.spectrum(self.signal, self.dtype))
+
+        return ENGINES[engine](self.amp, self.fs, self.dtype)
+
+    def set_view(self, view):
+        self.view = view
+        self.input_pyramid = WaveformPyramid(channel_view(self.amp, view))
+        self.output_pyramid = WaveformPyramid(channel_view(self.output, view))
+        self.input_spectrogram = None
+
+    def renderer(self, engine="fft"):
+        if engine not in self.renderers:
+            self.renderers[engine] = self.build(engine)
+
+        return self.renderers[engine]
+
+    def spectrogram(self):
+        if self.input_spectrogram is None:
+            self.input_spectrogram = self.shared.spectrogram(self.signal, self.view)
+
+        return self.input_spectrogram
+
+    def result_key(self, engine, mode, gains_db, *extra):
+        # what a result depends on besides the samples; extra tells apart
+        # results of another kind, such as output spectrograms
+        return (self.key, engine, np.dtype(self.dtype).name, mode, self.view,
+                quantize_gains(gains_db)) + extra
+
+    def owns(self, renderer):
+        return any(renderer is own for own in self.renderers.values())
+
+    def set_output(self, output, pyramid=None, view=None):
+        self.output = output
+
+        if pyramid is None or view not in (None, self.view):
+            pyramid = WaveformPyramid(channel_view(output, self.view))
+
+        self.output_pyramid = pyramid
+
+    def memory_report(self):
+        if not self.loaded:
+            return {}
+
+        return {
+            "samples": self.amp.nbytes,
+            "time": self.time.nbytes,
+            "output": self.output.nbytes,
+            "input_pyramid": self.input_pyramid.nbytes,
+            "output_pyramid": self.output_pyramid.nbytes,
+            "input_spectrogram": 0 if self.input_spectrogram is None else self.input_spectrogram.power.nbytes,
+        }
+
+    def audio(self, amp):
+        # the audio panes want (samples x channels) in [-1, 1]
+        return (np.asarray(amp).T / np.float32(self.full_scale)).astype(np.float32, copy=False)
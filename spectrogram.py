@@ -0,0 +1,41 @@
+import numpy as np
+import scipy.signal
+
+
+class Spectrogram:
+    # STFT power of the input, computed once per file. Every engine is a
+    # linear filter, so the output spectrogram is the cached power scaled by
+    # the engine's squared magnitude response at self.freq instead of a new
+    # STFT of the output signal.
+
+    def __init__(self, amp, fs, nfft=1024, noverlap=128):
+        self.freq, self.times, power = scipy.signal.spectrogram(
+            np.asarray(amp, dtype=float), fs=fs, window="hann", nperseg=nfft, noverlap=noverlap)
+
+        self.power = power.astype(np.float32)
+        self.pooled_power = {}
+
+    @property
+    def extent(self):
+        return self.times[0], self.times[-1], self.freq[0], self.freq[-1]
+
+    def pooled(self, max_columns=None):
+        # max over groups of frames, so long files send about one column per
+        # pixel; band gains scale whole rows, so pooling before the gains are
+        # applied gives the same picture
+        if max_columns is None or self.power.shape[1] <= max_columns:
+            return self.power
+
+        if max_columns not in self.pooled_power:
+            edges = np.linspace(0, self.power.shape[1], max_columns + 1).astype(np.int64)
+            self.pooled_power[max_columns] = np.maximum.reduceat(self.power, edges[:-1], axis=1)
+
+        return self.pooled_power[max_columns]
+
+    def equalized(self, response, max_columns=None):
+        # response is the magnitude response at self.freq
+        return self.pooled(max_columns) * (np.abs(response) ** 2).astype(np.float32)[:, np.newaxis]
+
+
+def to_db(power):
+    return 10 * np.log10(np.maximum(power, 1e-12))
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from scipy.fft import next_fast_len, rfftfreq
+from scipy.signal import sosfreqz
+
+from equalizer import (MODE_BANDS, IncrementalRenderer, InputSpectrum, band_edges, equalize,
+                       plan_edges, precision_error)
+from filterbank import band_sos
+from streaming import equalize_streaming
+
+
+# fixed-seed white noise in 16-bit units, like a loud two-channel recording
+FS = 44100
+BANDS = MODE_BANDS["default"]
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+@pytest.fixture
+def amp(rng):
+    return (rng.standard_normal((2, FS * 5)) * 3000).astype(np.float32)
+
+
+@pytest.mark.parametrize("n_samples, fs", [(FS * 5, FS), (1000003, 48000), (123457, 8000)])
+def test_plan_edges_match_bin_frequencies(n_samples, fs):
+    # the edges are worked out without the bin frequencies of the padded length
+    freq = rfftfreq(next_fast_len(n_samples, real=True), d=1.0/fs)
+
+    np.testing.assert_array_equal(plan_edges(n_samples, fs, tuple(BANDS)), band_edges(freq, BANDS))
+
+
+@pytest.mark.parametrize("limit", [6, 20])
+def test_float32_matches_float64(amp, rng, limit):
+    # measured around 2.3e-7 relative RMS and 0.02 peak
+    max_error, relative_rms = precision_error(amp, FS, rng.uniform(-limit, limit, 10), BANDS)
+
+    assert relative_rms < 1e-6
+    # far below one 16-bit step
+    assert max_error < 0.5
+
+
+@pytest.mark.parametrize("limit, tolerance", [(6, 0.01), (20, 0.06)])
+def test_overlap_add_matches_fft_mask(amp, rng, limit, tolerance):
+    # the tolerances documented at the top of streaming.py
+    gains_db = rng.uniform(-limit, limit, 10)
+
+    expected = equalize(amp, FS, gains_db, BANDS, np.float64)
+    output = equalize_streaming(amp, FS, gains_db, BANDS, dtype=np.float64)
+
+    error = output - expected
+    assert np.sqrt(np.mean(error ** 2) / np.mean(expected ** 2)) < tolerance
+
+
+def test_incremental_render_matches_full_render(amp, rng):
+    # a long drag of single sliders, shorter than full_render_every so the
+    # float32 rounding of the multiply-adds accumulates
+    spectrum = InputSpectrum(amp, FS, MODE_BANDS, np.float32)
+    renderer = IncrementalRenderer(spectrum)
+    gains_db = np.zeros(10)
+
+    for _ in range(200):
+        gains_db[rng.integers(10)] = round(rng.uniform(-20, 20), 1)
+
+        output = renderer.render("default", gains_db.copy())
+        expected = spectrum.render("default", gains_db)
+
+        error = output - expected
+        assert np.sqrt(np.mean(error ** 2) / np.mean(expected ** 2)) < 1e-5
+
+
+@pytest.mark.parametrize("limit", [6, 20])
+def test_filter_bank_hits_sliders_at_band_centres(rng, limit):
+    # documented at the top of filterbank.py
+    gains_db = tuple(rng.uniform(-limit, limit, 10))
+    centres = np.array([np.sqrt(low * high) for low, high in BANDS])
+
+    _, response = sosfreqz(band_sos(FS, gains_db, tuple(BANDS)), worN=centres, fs=FS)
+
+    np.testing.assert_allclose(20 * np.log10(np.abs(response)), gains_db, atol=0.05)
+
+
+def test_flat_filter_bank_is_identity():
+    np.testing.assert_array_equal(band_sos(FS, (0,) * 10, tuple(BANDS)), [[1, 0, 0, 1, 0, 0]])
@@ -0,0 +1,42 @@
+import pytest
+
+from audio_server import byte_range
+
+
+SIZE = 10000
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-1023", (0, 1024)),
+    ("bytes=9000-20000", (9000, SIZE)),
+    ("bytes=500-", (500, SIZE)),
+    ("bytes=-1000", (SIZE - 1000, SIZE)),
+    ("bytes=-20000", (0, SIZE)),
+    (" bytes=0-0 ", (0, 1)),
+])
+def test_single_ranges(header, expected):
+    assert byte_range(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", [
+    "",
+    "bytes=-",
+    "bytes=0-99,200-299",
+    "bytes=0-99, 200-",
+    "items=0-99",
+    "bytes=abc-",
+])
+def test_unsupported_headers_get_the_whole_body(header):
+    assert byte_range(header, SIZE) is None
+
+
+@pytest.mark.parametrize("header", [
+    "bytes=10000-",
+    "bytes=20000-30000",
+    "bytes=500-100",
+    "bytes=-0",
+])
+def test_unsatisfiable_ranges_raise(header):
+    # answered with 416 by AudioHandler
+    with pytest.raises(ValueError):
+        byte_range(header, SIZE)
@@ -0,0 +1,116 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from loaders import COLUMN_FULL_SCALE, RAW_PCM, READERS, from_columns, read_pcm
+
+
+# 100 rows at 1 kHz, two channels in 16-bit units
+TIME = np.arange(100) / 1000
+CHANNELS = np.stack([np.sin(TIME * 300) * 1000, np.cos(TIME * 300) * 1000])
+
+
+def csv_bytes(columns, header="time,amp1,amp2"):
+    return (header + "\n" + "\n".join(",".join(map(str, row)) for row in columns)).encode()
+
+
+def npy_bytes(array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+def check_columns(fs, time, amp, full_scale):
+    assert fs > 0
+    np.testing.assert_allclose(np.asarray(time), TIME)
+    assert amp.dtype == np.float32 and amp.flags.c_contiguous
+    np.testing.assert_allclose(amp, CHANNELS, rtol=1e-6, atol=1e-3)
+    assert full_scale == COLUMN_FULL_SCALE
+
+
+def test_csv():
+    check_columns(*READERS["csv"](csv_bytes(np.column_stack([TIME, CHANNELS.T]))))
+
+
+def test_npy_columns():
+    check_columns(*READERS["npy"](npy_bytes(np.column_stack([TIME, CHANNELS.T]))))
+
+
+def test_fortran_ordered_npy():
+    check_columns(*READERS["npy"](npy_bytes(np.asfortranarray(np.column_stack([TIME, CHANNELS.T])))))
+
+
+def test_parquet():
+    pytest.importorskip("pyarrow")
+    buffer = io.BytesIO()
+    pd.DataFrame({"time": TIME, "amp1": CHANNELS[0], "amp2": CHANNELS[1]}).to_parquet(buffer)
+
+    check_columns(*READERS["parquet"](buffer.getvalue()))
+
+
+def test_uniform_time_column_is_not_stored():
+    _, time, _, _ = READERS["csv"](csv_bytes(np.column_stack([TIME, CHANNELS.T])))
+    assert time.nbytes == 0
+
+
+def test_uneven_time_column_is_kept():
+    times = np.array([0.0, 0.1, 0.25, 0.3])
+    _, time, _, _ = from_columns(np.column_stack([times, np.ones(4)]))
+
+    np.testing.assert_array_equal(np.asarray(time), times)
+    assert time.searchsorted(0.2) == 2
+
+
+def test_mono_npy_is_samples_at_the_raw_rate():
+    samples = np.array([1, -2, 3], dtype=np.int16)
+    fs, time, amp, full_scale = READERS["npy"](npy_bytes(samples))
+
+    assert fs == RAW_PCM["fs"] and len(time) == 3
+    np.testing.assert_array_equal(amp, [samples])
+    assert full_scale == 32767
+
+
+def test_pcm():
+    frames = np.array([[1, -1], [2, -2], [3, -3]], dtype="<i2")
+    fs, time, amp, full_scale = read_pcm(frames.tobytes() + b"\0", fs=16000, channels=2)
+
+    assert fs == 16000 and len(time) == 3
+    np.testing.assert_array_equal(amp, frames.T)
+    assert amp.flags.c_contiguous
+    assert full_scale == 32767
+
+
+def test_float32_pcm_is_not_copied():
+    samples = np.array([0.5, -0.5], dtype="<f4")
+    data = samples.tobytes()
+    _, _, amp, full_scale = read_pcm(data, dtype="<f4")
+
+    assert not amp.flags.owndata
+    assert full_scale == 1.0
+
+
+@pytest.mark.parametrize("data", [
+    b"time,amp\n0,1\n",
+    b"time,amp\n0,1\n0,2\n",
+    b"time,amp\n0,1\n0.2,2\n0.1,3\n",
+    b"time,amp\n0,a\n0.1,b\n",
+    b"time,amp\nx,1\ny,2\n",
+    b"time,amp\n0,1\n10,2\n",
+    b"time\n0\n0.1\n",
+], ids=["one row", "repeated time", "decreasing time", "text samples", "text times", "below 1 Hz",
+        "no channels"])
+def test_bad_csv_raises_value_error(data):
+    with pytest.raises(ValueError):
+        READERS["csv"](data)
+
+
+@pytest.mark.parametrize("array", [
+    np.array([[0.0, 1.0]]),
+    np.array([[0.0, 1.0], [0.0, 2.0]]),
+    np.array([["0", "a"], ["1", "b"]]),
+], ids=["one row", "repeated time", "text"])
+def test_bad_npy_raises_value_error(array):
+    with pytest.raises(ValueError):
+        READERS["npy"](npy_bytes(array))
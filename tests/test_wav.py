@@ -0,0 +1,134 @@
+import io
+import struct
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from loaders import READERS, read_pcm, wav_frames
+
+
+FS = 8000
+
+
+def chunk(chunk_id, payload):
+    # RIFF chunks are padded to an even length, the size field is not
+    return struct.pack("<4sI", chunk_id, len(payload)) + payload + b"\0" * (len(payload) & 1)
+
+
+def fmt_chunk(format_tag, channels, bits, fs=FS, extensible=False):
+    block_align = channels * bits // 8
+    payload = struct.pack("<HHIIHH", 0xFFFE if extensible else format_tag, channels, fs,
+                          fs * block_align, block_align, bits)
+
+    if extensible:
+        # cbSize, valid bits, channel mask, then the sub-format GUID
+        payload += struct.pack("<HHI", 22, bits, 0) + struct.pack("<H", format_tag) + b"\0" * 14
+
+    return chunk(b"fmt ", payload)
+
+
+def wav_bytes(frames, format_tag=1, extensible=False, before_data=b""):
+    # frames is (samples x channels) of the dtype to store
+    frames = np.atleast_2d(frames.T).T
+    body = (b"WAVE" + fmt_chunk(format_tag, frames.shape[1], frames.dtype.itemsize * 8, extensible=extensible)
+            + before_data + chunk(b"data", frames.tobytes()))
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+@pytest.fixture
+def stereo():
+    return np.random.default_rng(0).integers(-32768, 32767, (1000, 2), dtype=np.int16)
+
+
+def test_int16_frames_are_a_view_on_the_upload(stereo):
+    data = wav_bytes(stereo)
+    fs, frames = wav_frames(data)
+
+    assert fs == FS
+    np.testing.assert_array_equal(frames, stereo)
+    assert frames.base is not None
+
+
+def test_read_wav_returns_c_ordered_channels(stereo):
+    fs, time, amp, full_scale = READERS["wav"](wav_bytes(stereo))
+
+    assert amp.shape == (2, 1000) and amp.dtype == np.float32
+    assert amp.flags.c_contiguous
+    np.testing.assert_array_equal(amp, stereo.T)
+    assert full_scale == 32767
+    assert len(time) == 1000 and time[1] == pytest.approx(1 / FS)
+
+
+def test_u8_is_centred_on_zero():
+    frames = np.array([0, 128, 255], dtype=np.uint8)
+    _, _, amp, full_scale = READERS["wav"](wav_bytes(frames))
+
+    np.testing.assert_array_equal(amp, [[-128, 0, 127]])
+    assert full_scale == 128
+
+
+def test_float_wav_has_unit_full_scale():
+    frames = np.array([-1.0, 0.5, 1.0], dtype="<f4")
+    _, _, amp, full_scale = READERS["wav"](wav_bytes(frames, format_tag=3))
+
+    np.testing.assert_array_equal(amp, [frames])
+    assert full_scale == 1.0
+
+
+def test_extensible_format_uses_the_sub_format(stereo):
+    _, frames = wav_frames(wav_bytes(stereo, extensible=True))
+
+    np.testing.assert_array_equal(frames, stereo)
+
+
+def test_odd_sized_chunks_are_padded(stereo):
+    data = wav_bytes(stereo, before_data=chunk(b"LIST", b"abc") + chunk(b"junk", b"x"))
+    _, frames = wav_frames(data)
+
+    np.testing.assert_array_equal(frames, stereo)
+
+
+def test_24_bit_falls_back_to_scipy():
+    buffer = io.BytesIO()
+    sf.write(buffer, np.array([0.5, -0.5]), FS, subtype="PCM_24", format="WAV")
+    _, _, amp, full_scale = READERS["wav"](buffer.getvalue())
+
+    assert full_scale == 2**31 - 1
+    np.testing.assert_allclose(amp[0] / full_scale, [0.5, -0.5], atol=1e-6)
+
+
+def test_short_data_chunk_keeps_whole_frames(stereo):
+    # the declared data size runs past the end of the upload
+    data = wav_bytes(stereo)[:-3]
+    _, frames = wav_frames(data)
+
+    np.testing.assert_array_equal(frames, stereo[:-1])
+
+
+@pytest.mark.parametrize("size", [0, 11, 20, 30, 36])
+def test_truncated_headers_raise_value_error(stereo, size):
+    with pytest.raises(ValueError):
+        READERS["wav"](wav_bytes(stereo)[:size])
+
+
+def test_header_only_wav_raises_value_error(stereo):
+    with pytest.raises(ValueError):
+        READERS["wav"](wav_bytes(stereo[:0]))
+
+
+def test_zero_channels_raises_value_error():
+    body = b"WAVE" + chunk(b"fmt ", struct.pack("<HHIIHH", 1, 0, FS, 0, 0, 16)) + chunk(b"data", b"\0" * 8)
+
+    with pytest.raises(ValueError):
+        READERS["wav"](b"RIFF" + struct.pack("<I", len(body)) + body)
+
+
+def test_not_a_wav_raises_value_error():
+    with pytest.raises(ValueError):
+        READERS["wav"](b"ID3" + b"\0" * 100)
+
+
+def test_empty_pcm_raises_value_error():
+    with pytest.raises(ValueError):
+        read_pcm(b"")
@@ -0,0 +1,112 @@
+import numpy as np
+
+
+def channel_view(amp, view="mix"):
+    # the 1-D signal plotted for a (channels x samples) array: one channel by
+    # index, or "mix" for the average of all of them
+    if amp.ndim == 1:
+        return amp
+
+    if view == "mix":
+        return amp[0] if len(amp) == 1 else amp.mean(axis=0)
+
+    return amp[view]
+
+
+def visible_slice(time, start=None, end=None):
+    # time is a sample time array or a loaders.SampleTimes, which finds the
+    # window from the sample rate instead of a stored time per sample
+    i0 = 0 if start is None else time.searchsorted(start, side="left") - 1
+    i1 = len(time) if end is None else time.searchsorted(end, side="right") + 1
+    return max(i0, 0), min(i1, len(time))
+
+
+class WaveformPyramid:
+    # Min/max envelopes of a signal at block sizes factor, factor**2, ... kept
+    # as float32, so a view of any width is reduced from the coarsest level
+    # that still has at least one block per bucket instead of the raw samples.
+
+    def __init__(self, amp, factor=4, min_blocks=1024):
+        self.factor = factor
+        self.n_samples = len(amp)
+        self.levels = []
+
+        lows = highs = np.asarray(amp, dtype=np.float32)
+        block = 1
+
+        while len(lows) > min_blocks:
+            lows = self._reduce(lows, np.minimum)
+            highs = self._reduce(highs, np.maximum)
+            block *= factor
+            self.levels.append((block, lows, highs))
+
+    def _reduce(self, values, ufunc):
+        # strided elementwise passes are much faster than reducing along a
+        # short axis, and the shorter phases simply leave the tail block alone
+        reduced = values[0::self.factor].copy()
+        for phase in range(1, self.factor):
+            strided = values[phase::self.factor]
+            ufunc(reduced[:len(strided)], strided, out=reduced[:len(strided)])
+        return reduced
+
+    @property
+    def nbytes(self):
+        return sum(lows.nbytes + highs.nbytes for _, lows, highs in self.levels)
+
+    def level_for(self, bucket_size):
+        best = None
+        for level in self.levels:
+            if level[0] > bucket_size:
+                break
+            best = level
+        return best
+
+    def reduce(self, edges):
+        level = self.level_for((edges[-1] - edges[0]) // (len(edges) - 1))
+
+        if level is None:
+            return None
+
+        block, lows, highs = level
+        first, last = edges[0] // block, -(-edges[-1] // block)
+        starts = edges[:-1] // block - first
+
+        return (np.minimum.reduceat(lows[first:last], starts),
+                np.maximum.reduceat(highs[first:last], starts))
+
+
+def minmax_decimate(time, amp, start=None, end=None, n_points=2000, pyramid=None, view="mix"):
+    # Splits the visible window into n_points / 2 buckets and keeps the min
+    # and max of every bucket, placed at the bucket's first and middle sample,
+    # so peaks survive while the payload only depends on the plot width.
+    # Multi-channel amp is reduced to `view` for the visible window only.
+    # x only depends on time and the window, never on amp, so signals of the
+    # same length decimated over the same window share it; y is float32.
+    i0, i1 = visible_slice(time, start, end)
+    n_buckets = n_points // 2
+
+    if i1 - i0 <= n_points:
+        return time[i0:i1], np.asarray(channel_view(amp[..., i0:i1], view), dtype=np.float32)
+
+    edges = np.linspace(i0, i1, n_buckets + 1).astype(np.int64)
+
+    reduced = None
+    if pyramid is not None:
+        reduced = pyramid.reduce(edges)
+
+    if reduced is None:
+        window = channel_view(amp[..., i0:i1], view)
+        reduced = (np.minimum.reduceat(window, edges[:-1] - i0),
+                   np.maximum.reduceat(window, edges[:-1] - i0))
+
+    lows, highs = reduced
+
+    x = np.empty(2 * n_buckets, dtype=time.dtype)
+    x[0::2] = time[edges[:-1]]
+    x[1::2] = time[(edges[:-1] + edges[1:]) // 2]
+
+    y = np.empty(2 * n_buckets, dtype=np.float32)
+    y[0::2] = lows
+    y[1::2] = highs
+
+    return x, y